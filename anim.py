@@ -0,0 +1,79 @@
+from collections import deque
+from kivy.animation import Animation
+
+from tracer import TRACE
+
+# queue of steps to animate - each step is run in turn and the cards it moved
+# slide into place before the next step is started
+class AnimQueue(object):
+    transition = 'out_quad'
+
+    def __init__(self, duration=0.15):
+        self.duration = duration
+        self.steps = deque()
+        self.tweens = []
+        self.callback = None
+        self.running = False
+        self.instant = False
+
+    # add a step to the end of the queue - func(*args) is called when it is reached and returns
+    # a list of (widget, start_pos) to slide into place, callback is called once they have arrived
+    def add(self, func, *args, **kwargs):
+        self.steps.append((func, args, kwargs.get('callback')))
+        if not self.running:
+            self.next()
+
+    # add a batch of (func, args) steps
+    def extend(self, steps):
+        self.steps.extend((func, args, None) for func, args in steps)
+        if not self.running:
+            self.next()
+
+    def busy(self):
+        return self.running or len(self.steps) > 0
+
+    # run steps from the queue until we get to one which needs to be animated
+    def next(self, *args):
+        self.running = True
+        while self.steps:
+            func, args, callback = self.steps.popleft()
+            tweens = func(*args)
+            if tweens and self.duration > 0 and not self.instant:
+                self.start(tweens, callback)
+                return
+            if callback: callback()
+        self.running = False
+
+    # slide each widget from start position to where it is now
+    def start(self, tweens, callback):
+        self.callback = callback
+        self.tweens = []
+        for widget, pos in tweens:
+            target = tuple(widget.pos)
+            widget.pos = pos
+            anim = Animation(pos=target, d=self.duration, t=self.transition)
+            anim.start(widget)
+            self.tweens.append((widget, target, anim))
+        anim.bind(on_complete=self.done)
+
+    # called when the last animation in the step has finished
+    def done(self, *args):
+        self.tweens = []
+        callback, self.callback = self.callback, None
+        if callback: callback()
+        self.next()
+
+    # jump to the end of the current animation and run any queued steps immediately
+    def flush(self):
+        if not self.busy() or self.instant: return
+        TRACE.add('flush', len(self.steps))
+        self.instant = True
+        for widget, target, anim in self.tweens:
+            anim.cancel(widget)
+            widget.pos = target
+        self.tweens = []
+        callback, self.callback = self.callback, None
+        if callback: callback()
+        if self.steps: self.next()
+        self.running = False
+        self.instant = False
@@ -0,0 +1,129 @@
+import os
+# options are for the batch run - kivy reads this when it is first imported
+if __name__ == '__main__':
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+import argparse
+import multiprocessing
+import time
+from array import array
+from kivy.logger import Logger
+
+from library import DealLibrary, rate
+from registry import GAMES
+
+# results are stored in a folder with one file per column, rows are added a chunk at a time
+# as chunks finish, and the checkpoint file has a line for each chunk written:
+#   start count rows  - where rows is the total no. of rows after the chunk was added
+COLUMNS = [('seed', 'I'), ('verdict', 'B'), ('moves', 'H'), ('nodes', 'I'), ('time', 'f')]
+CHECKPOINT = 'checkpoint'
+
+
+# solve deals start..start+count-1 of game cls, returns columns for the chunk
+def solve_chunk(args):
+    cls, start, count, max_nodes = args
+    columns = dict((name, array(code)) for name, code in COLUMNS)
+    for seed in range(start, start+count):
+        t = time.time()
+        result = rate((cls, seed, max_nodes))
+        result['time'] = time.time() - t
+        result['verdict'] = DealLibrary.verdicts.index(result['verdict'])
+        result['moves'] = min(result['moves'], 0xffff)
+        for name, _ in COLUMNS:
+            columns[name].append(result[name])
+    return start, count, columns
+
+
+# (start, count) for each chunk already done, and drop any rows written after the last checkpoint
+def resume(folder):
+    done, rows = [], 0
+    path = os.path.join(folder, CHECKPOINT)
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                start, count, rows = [int(x) for x in line.split()]
+                done.append((start, count))
+    for name, code in COLUMNS:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            with open(path, 'r+b') as f:
+                f.truncate(rows*array(code).itemsize)
+    return done, rows
+
+
+# (start, count) for chunks of up to chunk deals covering the deals in first..last which are
+# not in the done ranges - so a run can be resumed with a different range or chunk size
+def missing(done, first, last, chunk):
+    todo, pos = [], first
+    for start, count in sorted(done) + [(last+1, 0)]:
+        end = min(start, last+1)
+        while pos < end:
+            todo.append((pos, min(chunk, end-pos)))
+            pos += todo[-1][1]
+        pos = max(pos, start+count)
+    return todo
+
+
+# solve deals first..last of game cls on a pool of jobs processes, results go to folder
+def run(cls, first, last, folder, chunk=1000, max_nodes=50000, jobs=None):
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    done, rows = resume(folder)
+    todo = [(cls, start, count, max_nodes) for start, count in missing(done, first, last, chunk)]
+    Logger.info("Cards: batch %s deals %d-%d, %d chunks to do, %d rows done" %
+                (cls.name, first, last, len(todo), rows))
+    pool = multiprocessing.Pool(jobs)
+    checkpoint = open(os.path.join(folder, CHECKPOINT), 'a')
+    try:
+        for start, count, columns in pool.imap_unordered(solve_chunk, todo):
+            for name, _ in COLUMNS:
+                with open(os.path.join(folder, name), 'ab') as f:
+                    columns[name].tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            rows += count
+            checkpoint.write('%d %d %d\n' % (start, count, rows))
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+            Logger.info("Cards: batch chunk %d done, %d rows" % (start, rows))
+    finally:
+        checkpoint.close()
+        pool.terminate()
+        pool.join()
+    return rows
+
+
+# read results from folder as a dict of column arrays
+def load(folder):
+    _, rows = resume(folder)
+    columns = {}
+    for name, code in COLUMNS:
+        columns[name] = array(code)
+        with open(os.path.join(folder, name), 'rb') as f:
+            columns[name].fromfile(f, rows)
+    return columns
+
+
+def summary(columns):
+    rows = len(columns['seed'])
+    counts = [0] * len(DealLibrary.verdicts)
+    for verdict in columns['verdict']:
+        counts[verdict] += 1
+    text = ', '.join('%s %d' % (name, n) for name, n in zip(DealLibrary.verdicts, counts))
+    return '%d deals: %s, %.3fs per deal' % (rows, text, sum(columns['time'])/max(rows, 1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='solve a range of deals, resuming where the last run stopped')
+    parser.add_argument('game', help='game name')
+    parser.add_argument('first', type=int, help='first deal no.')
+    parser.add_argument('last', type=int, help='last deal no.')
+    parser.add_argument('-o', '--out', help='results folder - default is batch/<game>')
+    parser.add_argument('-c', '--chunk', type=int, default=1000, help='deals per checkpoint')
+    parser.add_argument('--nodes', type=int, default=50000, help='solver node budget per deal')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+    cls = GAMES[args.game]
+    name = os.path.splitext(os.path.basename(DealLibrary.path_for(cls.name)))[0]
+    folder = args.out or os.path.join('batch', name)
+    run(cls, args.first, args.last, folder, args.chunk, args.nodes, args.jobs)
+    print(summary(load(folder)))
@@ -0,0 +1,147 @@
+import os
+# command line options are for the benchmark, not for kivy
+if __name__ == '__main__':
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+import argparse
+import gc
+import json
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from cards import Deck
+from registry import GAMES, GAME_LIST
+import replay
+
+
+# replay of a random game of cls from deal seed, with up to num moves - the game engine
+# makes the moves so any refills and other follow on moves are included
+def random_game(cls, seed, num):
+    player = replay.Replayer(cls)
+    deck = Deck(cls.decks)
+    deck.rewind(shuffle=True, seed=seed)
+    player.deal(deck)
+    rng = random.Random(seed)
+    game, moves = player.game, []
+    for _ in range(num):
+        player.moves = []
+        legal = game.legal_moves()
+        if legal:
+            game.try_move(*rng.choice(legal))
+        elif hasattr(game, 'deal_next'):
+            game.deal_next()
+        if not player.moves: break
+        moves += player.moves
+    return dict(version=replay.VERSION, game=cls.name, deal=seed, moves=moves,
+                score=game.foundation_cards, final=replay.encode_piles(game.snapshot()))
+
+
+# fixed set of games for cls - read from folder if it has been saved, so the same
+# moves are used after the rules change
+def corpus(cls, seeds, num, folder=None):
+    replays = []
+    for seed in seeds:
+        path = folder and os.path.join(folder, '%s-%d.replay' % (cls.name.lower().replace(' ', '_'), seed))
+        if path and os.path.exists(path):
+            replays.append(replay.load(path))
+            continue
+        replays.append(random_game(cls, seed, num))
+        if path: replay.save(path, replays[-1])
+    return replays
+
+
+# play each replay through the rules, checking every move - and undoing them if undo is set
+def play_all(player, replays, undo=False):
+    errors = 0
+    for r in replays:
+        if player.verify(r, undo): errors += 1
+    return errors
+
+
+# no. of can_add calls made by legal_moves in each position of the replays
+def count_checks(player, replays):
+    game, checks = player.game, 0
+    for r in replays:
+        player.deal(replay.deck_for(r))
+        for text in r['moves']:
+            checks += checks_at(game)
+            game.do_move(replay.decode_move(text))
+    return checks
+
+
+def checks_at(game):
+    piles = game.all_piles()
+    count = 0
+    for orig in piles:
+        top = orig.top_card()
+        if top is None or not top.faceup: continue
+        count += (1 if orig.type == 'foundation' else orig.movable()) * (len(piles)-1)
+    return count
+
+
+# list legal moves in each position of the replays
+def check_all(player, replays):
+    game = player.game
+    for r in replays:
+        player.deal(replay.deck_for(r))
+        for text in r['moves']:
+            game.legal_moves()
+            game.do_move(replay.decode_move(text))
+
+
+def timed(func, *args):
+    gc.collect()
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+# moves and legality checks per second, and peak memory while playing, for game cls
+def run(cls, seeds, num, folder=None, repeat=3):
+    replays = corpus(cls, seeds, num, folder)
+    player = replay.Replayer(cls)
+    moves = sum(len(r['moves']) for r in replays)
+    checks = count_checks(player, replays)
+    play_time = min(timed(play_all, player, replays)[0] for _ in range(repeat))
+    errors = play_all(player, replays, undo=True)
+    check_time = min(timed(check_all, player, replays)[0] for _ in range(repeat))
+    tracemalloc.start()
+    play_all(player, replays)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(game=cls.name, decks=cls.decks, games=len(replays), moves=moves, errors=errors,
+                moves_per_sec=moves/play_time, checks=checks, checks_per_sec=checks/check_time,
+                peak_kb=peak/1024.0)
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time the rules for each game over a fixed set of recorded games')
+    parser.add_argument('games', nargs='*', help='game names - all if not given')
+    parser.add_argument('-d', '--decks', type=int, nargs='*', help='only games with this no. of decks')
+    parser.add_argument('-n', '--count', type=int, default=50, help='no. of games for each variant')
+    parser.add_argument('-m', '--moves', type=int, default=300, help='max. moves in each game')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs of each game, the best is kept')
+    parser.add_argument('-c', '--corpus', help='folder for the recorded games, created on first use')
+    parser.add_argument('-o', '--out', help='append json lines to this file - default is stdout')
+    args = parser.parse_args()
+    names = args.games or [name for name, _, _, decks in GAME_LIST if not args.decks or decks in args.decks]
+    if args.corpus and not os.path.isdir(args.corpus):
+        os.makedirs(args.corpus)
+    rev, now = commit(), time.time()
+    out = open(args.out, 'a') if args.out else sys.stdout
+    for name in names:
+        result = run(GAMES[name], range(args.count), args.moves, args.corpus, args.repeat)
+        result.update(commit=rev, time=now)
+        out.write(json.dumps(result, sort_keys=True) + '\n')
+        out.flush()
+    if args.out: out.close()
@@ -0,0 +1,171 @@
+import os
+# no display needed - kivy draws with the mock gl backend
+if __name__ == '__main__':
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+import argparse
+import gc
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from kivy.app import App
+from kivy.core.window import Window
+from kivy.lang import Builder
+
+from bench_rules import commit
+from cards import Deck
+from main import Solitaire
+from registry import GAMES, GAME_LIST
+
+PHASES = ['start', 'moves', 'undo', 'redo', 'resize', 'save', 'restore']
+
+
+# app with the config file and user data in a scratch folder
+class BenchApp(Solitaire):
+
+    def __init__(self, folder, **kwargs):
+        self.folder = folder
+        super(BenchApp, self).__init__(**kwargs)
+
+    @property
+    def user_data_dir(self):
+        return self.folder
+
+    def get_application_config(self, defaultpath=None):
+        return os.path.join(self.folder, 'solitaire.ini')
+
+
+# set up the app as App.run would, without starting the event loop
+def make_app(folder):
+    app = BenchApp(folder)
+    App._running_app = app
+    app.load_config()
+    app.config.set('settings', 'animate', 0)
+    app.root = Builder.load_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solitaire.kv'))
+    Window.add_widget(app.root)
+    app.build()
+    return app
+
+
+# wall time and no. of blocks allocated for one call of func
+def measure(func, *args):
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    return elapsed, sys.getallocatedblocks() - blocks
+
+
+def new_deal(app, seed):
+    app.game.clear(1)
+    app.deck = Deck(app.game.decks)
+    app.deck.rewind(shuffle=True, seed=seed)
+    app.deck.save(app.config)
+    app.config.set('game', 'won', False)
+    app.set_moves(reset=True)
+
+
+# make up to num moves picked at random from the legal ones, dealing if there are none
+def play(app, num, seed):
+    rng = random.Random(seed)
+    game = app.game
+    for _ in range(num):
+        legal = game.legal_moves()
+        if legal:
+            game.try_move(*rng.choice(legal))
+        elif hasattr(game, 'deal_next'):
+            key = game.hash
+            game.deal_next()
+            if game.hash == key: break
+        else:
+            break
+        app.anim.flush()
+
+
+def undo_all(app):
+    while app.moves > 0:
+        app.undo()
+    app.anim.flush()
+
+
+def redo_all(app):
+    while app.moves < app.max_moves:
+        app.redo()
+    app.anim.flush()
+
+
+def resize(app, sizes=((1024, 768), (1280, 800), (800, 600))):
+    for width, height in sizes:
+        app.set_window_size(width, height)
+        app.do_resize()
+
+
+def save(app):
+    for pile in app.game.all_piles():
+        pile.save(app.config)
+    app.config.write()
+
+
+def restore(app):
+    for pile in app.game.all_piles():
+        pile.load(app.config)
+    app.game.recount()
+
+
+# time each phase for game name - returns a result dict for each phase
+def run(app, name, seed, moves):
+    if app.game.name != name:
+        app.switch_game(name)
+    new_deal(app, seed)
+    phases = [('start', app.start), ('moves', lambda: play(app, moves, seed)),
+              ('undo', lambda: undo_all(app)), ('redo', lambda: redo_all(app)),
+              ('resize', lambda: resize(app)), ('save', lambda: save(app)), ('restore', lambda: restore(app))]
+    results = []
+    for phase, func in phases:
+        elapsed, blocks = measure(func)
+        results.append(dict(game=name, decks=GAMES.info(name)['decks'], seed=seed, phase=phase,
+                            seconds=elapsed, blocks=blocks, moves=app.max_moves))
+    return results
+
+
+# best time over repeats for each phase
+def best(results):
+    found = {}
+    for r in results:
+        key = (r['game'], r['phase'])
+        if key not in found or r['seconds'] < found[key]['seconds']:
+            found[key] = r
+    return [found[key] for key in sorted(found, key=lambda k: (k[0], PHASES.index(k[1])))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time dealing, moves, undo/redo, resize and save/restore for each game')
+    parser.add_argument('games', nargs='*', help='game names - all if not given')
+    parser.add_argument('-d', '--decks', type=int, nargs='*', help='only games with this no. of decks')
+    parser.add_argument('-m', '--moves', type=int, default=200, help='moves to make in each game')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs of each game, the best is kept')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='deal and move seed')
+    parser.add_argument('-o', '--out', help='append json lines to this file - default is stdout')
+    args = parser.parse_args()
+    names = args.games or [name for name, _, _, decks in GAME_LIST if not args.decks or decks in args.decks]
+    folder = tempfile.mkdtemp(prefix='kvsol-bench-')
+    try:
+        app = make_app(folder)
+        results = []
+        for name in names:
+            for _ in range(args.repeat):
+                results += run(app, name, args.seed, args.moves)
+        app.on_stop()
+    finally:
+        shutil.rmtree(folder)
+    rev, now = commit(), time.time()
+    out = open(args.out, 'a') if args.out else sys.stdout
+    for r in best(results):
+        r.update(commit=rev, time=now)
+        out.write(json.dumps(r, sort_keys=True) + '\n')
+    if args.out: out.close()
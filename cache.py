@@ -0,0 +1,136 @@
+import ast
+import mmap
+import os
+import struct
+import threading
+import zlib
+from kivy.logger import Logger
+
+from zobrist import MASK
+
+# on disk cache of solver results, keyed by game name and position
+#   path.idx: header then a hash table of fixed size slots - this is memory mapped so a
+#             lookup only touches the pages it needs rather than loading the whole cache
+#   path.dat: results stored one after another as python literals
+# when there are more than max_entries the least recently used are dropped
+class ResultCache(object):
+    magic = b'KVSC'
+    version = 4
+    header = struct.Struct('<4sIIII')   # magic, version, slots, count, clock
+    slot = struct.Struct('<QQII')       # key, offset, length, last used
+    keep = 0.75                         # fraction of entries kept on eviction
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.slots = 1
+        while self.slots < 2*max_entries:
+            self.slots *= 2
+        self.lock = threading.Lock()
+        self.open()
+
+    # 64 bit key for position state_key in game name
+    @staticmethod
+    def key(name, state):
+        return (state ^ zlib.crc32(name.encode()) * 0x9e3779b97f4a7c15) & MASK or 1
+
+    # open existing files, or create new ones if missing or the wrong size
+    def open(self):
+        size = self.header.size + self.slots*self.slot.size
+        index, data = self.path+'.idx', self.path+'.dat'
+        valid = os.path.exists(index) and os.path.exists(data) and os.path.getsize(index) == size
+        if valid:
+            with open(index, 'rb') as f:
+                magic, version, slots, _, _ = self.header.unpack(f.read(self.header.size))
+            valid = magic == self.magic and version == self.version and slots == self.slots
+        if not valid:
+            Logger.info("Cards: new solver cache %s" % self.path)
+            with open(index, 'wb') as f:
+                f.write(self.header.pack(self.magic, self.version, self.slots, 0, 0))
+                f.truncate(size)
+            open(data, 'wb').close()
+        self.index_file = open(index, 'r+b')
+        self.index = mmap.mmap(self.index_file.fileno(), size)
+        self.data_file = open(data, 'a+b')
+        self.data = None
+        _, _, _, self.count, self.clock = self.header.unpack_from(self.index, 0)
+
+    def close(self):
+        with self.lock:
+            self.write_header()
+            self.index.close()
+            self.index_file.close()
+            if self.data: self.data.close()
+            self.data_file.close()
+
+    def write_header(self):
+        self.header.pack_into(self.index, 0, self.magic, self.version, self.slots,
+                              self.count, self.clock)
+
+    # slot no. holding key, or the empty slot where it would go
+    def find(self, key):
+        i = key & (self.slots-1)
+        while True:
+            slot_key = self.slot.unpack_from(self.index, self.offset(i))[0]
+            if slot_key == key or slot_key == 0:
+                return i, slot_key == key
+            i = (i+1) & (self.slots-1)
+
+    def offset(self, i):
+        return self.header.size + i*self.slot.size
+
+    # read length bytes from data file - map it again if it has grown since last time
+    def read(self, pos, length):
+        if self.data is None or len(self.data) < pos+length:
+            if self.data: self.data.close()
+            self.data_file.flush()
+            self.data = mmap.mmap(self.data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.data[pos:pos+length]
+
+    # get result for key, or None if not cached
+    def get(self, key):
+        with self.lock:
+            i, found = self.find(key)
+            if not found: return None
+            _, pos, length, _ = self.slot.unpack_from(self.index, self.offset(i))
+            self.clock += 1
+            self.slot.pack_into(self.index, self.offset(i), key, pos, length, self.clock)
+            return ast.literal_eval(self.read(pos, length).decode())
+
+    # store result for key
+    def put(self, key, result):
+        text = repr(result).encode()
+        with self.lock:
+            self.data_file.seek(0, os.SEEK_END)
+            pos = self.data_file.tell()
+            self.data_file.write(text)
+            i, found = self.find(key)
+            if not found: self.count += 1
+            self.clock += 1
+            self.slot.pack_into(self.index, self.offset(i), key, pos, len(text), self.clock)
+            if self.count > self.max_entries:
+                self.evict()
+            self.write_header()
+
+    # drop the least recently used entries, and rewrite data file without the stale ones
+    def evict(self):
+        entries = []
+        for i in range(self.slots):
+            key, pos, length, used = self.slot.unpack_from(self.index, self.offset(i))
+            if key: entries.append((used, key, self.read(pos, length)))
+        entries.sort(reverse=True)
+        entries = entries[:int(self.max_entries*self.keep)]
+        Logger.info("Cards: solver cache evict %d entries" % (self.count-len(entries)))
+        self.index[self.header.size:] = bytes(len(self.index)-self.header.size)
+        if self.data: self.data.close()
+        self.data = None
+        self.data_file.seek(0)
+        self.data_file.truncate()
+        self.count = len(entries)
+        # renumber the clock so the ordering is kept
+        for n, (_, key, text) in enumerate(reversed(entries)):
+            pos = self.data_file.tell()
+            self.data_file.write(text)
+            i, _ = self.find(key)
+            self.slot.pack_into(self.index, self.offset(i), key, pos, len(text), n+1)
+        self.clock = len(entries)
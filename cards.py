@@ -9,6 +9,8 @@ class Card(object):
         self.rank = rank
         self.suit = suit
         self.faceup = faceup
+        # index from 0-51 used to look up rule tables
+        self.id = Deck.suits.index(suit)*13 + rank-1
    
     def __str__(self):
         return "%d%s faceup=%s" % (self.rank,self.suit,self.faceup)
@@ -54,10 +56,14 @@ class Deck(object):
         else:
             self.load(config)
  
-    def rewind(self, shuffle=False):
+    # if seed is given the shuffle always gives the same deal for that seed
+    def rewind(self, shuffle=False, seed=None):
         self.i = 0
+        if seed is not None:
+            self.d = [Card(r,s) for _ in range(self.decks) for s in self.suits for r in range(1,14)]
+            random.Random(seed).shuffle(self.d)
         for card in self.d: card.faceup = False
-        if shuffle: random.shuffle(self.d)
+        if shuffle and seed is None: random.shuffle(self.d)
 
     def get(self, index):
         return self.d[index]
@@ -1,9 +1,13 @@
-from functools import partial
-from kivy.core.window import Window
-from kivy.config import Config
 from kivy.logger import Logger
 
 from cards import Card, Deck
+from tracer import TRACE, ignore
+from zobrist import MASK, MAX_SLOTS, mix
+
+# pile types in the order they are hashed, and the slot each type is mixed with when the
+# piles of that type are interchangeable
+PILE_TYPES = ('tableau', 'foundation', 'waste')
+SWAP_SLOTS = dict((type, MAX_SLOTS-1-i) for i, type in enumerate(PILE_TYPES))
 
 # game base class - specific games inherit from this
 class BaseGame(object):
@@ -15,17 +19,31 @@ class BaseGame(object):
     num_rows = 5
     x_padding, y_padding = 0.02, 0.02
     fan_pile_scale = 0.18
+    # Rule for adding cards to each type of pile, and for grouping cards which can be
+    # picked up together - piles with no join rule group any face up cards
+    rules = {}
+    joins = {}
+    # types of pile whose order does not matter when comparing positions
+    symmetric = ['tableau']
+    # names of bool settings which change how the game plays - set from the config by the
+    # app, and kept with replays so they play back the same
+    options = []
 
-    def __init__(self, root=None, on_move=None, menu_size=0):
-        self.menu_size = menu_size
-        self.set_scale(Window.width, Window.height, menu=menu_size)
-        self.layout = root.layout
-        self.move = on_move
+    # board is drawn on root.layout in the area given by viewport = (x, y, width, height),
+    # default is the whole layout - games with no root have no display
+    def __init__(self, root=None, on_move=None, viewport=None):
+        self.layout = root.layout if root else None
+        self.viewport = None
+        if self.layout:
+            self.set_scale(viewport or tuple(self.layout.pos) + tuple(self.layout.size))
+        self.move = on_move or self.play
+        self.trace = TRACE.add if self.layout else ignore
         self.piles = dict(tableau=[], foundation=[], waste=[])
         self.num_foundation = 4*self.decks
         self.max_score = 52*self.decks
         self.num_piles = self.num_tableau + self.num_foundation + self.num_waste
         self.won = False
+        self.recount()
 
     # clear the board 
     def clear(self, base):
@@ -33,37 +51,106 @@ class BaseGame(object):
         for _, group in list(self.piles.items()):
             for pile in group: pile.clear(base)
         self.won = False
+        self.recount()
+
+    # take the empty board off the screen so it can be put back later without building it again
+    def detach(self):
+        for pile in self.all_piles(): pile.detach()
+        self.won = False
+        self.recount()
+
+    def attach(self):
+        for pile in self.all_piles(): pile.attach()
+
+    # deal a new game from the deck
+    def deal(self, deck):
+        for pile in self.tableau() + self.waste():
+            self.start(pile, deck)
+        self.recount()
+
+    # copy of the cards in each pile
+    def snapshot(self):
+        return [[card.export() for card in pile.stack] for pile in self.all_piles()]
+
+    # set up the piles from a snapshot
+    def restore(self, snapshot):
+        for pile, cards in zip(self.all_piles(), snapshot):
+            pile.clear(1)
+            pile.add_cards([Card(*c) for c in cards])
+            pile.sync()
+        self.recount()
 
-    # called on window resize
-    def do_resize(self):
-        width, height = Window.width, Window.height
-        self.set_scale(width, height, menu=self.menu_size)
+    # have all the cards been moved to the foundations?
+    def is_won(self):
+        return self.foundation_cards == self.max_score
+
+    # board counters - these are kept up to date by do_move so rules can check them quickly
+    def recount(self):
+        self.empty_tableau = len([p for p in self.tableau() if p.size() == 0])
+        self.empty_waste = len([p for p in self.waste() if p.size() == 0])
+        self.foundation_ranks = [0] * self.num_foundation
+        self.foundation_cards = 0
+        self.base = 0
+        for pile in self.foundation():
+            self.count(pile, 0)
+        # hash of the board, and for each type of pile the part of it from those piles and
+        # a sum over them which does not change if they are swapped round
+        self.hash = 0
+        self.type_hash = dict((type, 0) for type in PILE_TYPES)
+        self.swap_hash = dict((type, 0) for type in PILE_TYPES)
+        for pile in self.all_piles():
+            self.add_hash(pile, 1)
+        # positions visited, for repetition checks
+        self.seen = {self.state_key(): 1} if self.num_piles_added() else {}
+
+    # update counters after pile has changed from size cards
+    def count(self, pile, size):
+        if pile.type == 'foundation':
+            # base is the rank of the first card put on the foundations
+            top = pile.top_card()
+            self.foundation_ranks[pile.index] = top.rank if top else 0
+            self.foundation_cards += pile.size() - size
+            if self.foundation_cards == 0:
+                self.base = 0
+            elif size == 0 and self.base == 0:
+                self.base = pile.bottom_card().rank
+        elif (size == 0) != (pile.size() == 0):
+            delta = 1 if size else -1
+            if pile.type == 'tableau':
+                self.empty_tableau += delta
+            else:
+                self.empty_waste += delta
+
+    # called when the viewport changes - returns False if it is the same as before
+    def do_resize(self, viewport):
+        if viewport == self.viewport: return False
+        self.set_scale(viewport)
         for pile in self.all_piles():
             self.position_pile(pile)
             pile.redraw()
-        Config.set('graphics', 'width', width)
-        Config.set('graphics', 'height', height)
-        Config.write()
+        return True
 
-    # split window into rows and cols
-    def set_scale(self, width, height, menu=0):
-        Logger.info("Cards: window size = %d x %d" % (width, height))
+    # split viewport into rows and cols
+    def set_scale(self, viewport):
+        x, y, width, height = self.viewport = tuple(viewport)
+        Logger.info("Cards: viewport = %d x %d at %d, %d" % (width, height, x, y))
         self.padding = int(self.x_padding*width), int(self.y_padding*height)
-        h = (height-menu)/self.num_rows - self.padding[1]
+        h = height/self.num_rows - self.padding[1]
         csize = self._set_cell_size(int(h/Card.aspect_ratio), int(h))
         if self.num_cols*csize[0] <= width:
-            self.x0 = int((width-csize[0]*self.num_cols)/2) + self.padding[0]/2
-            self.y0 = height + self.padding[1]/2
-            Logger.debug("Cards: set scale from window height: origin = %d %d" % (self.x0,self.y0))
+            self.x0 = x + int((width-csize[0]*self.num_cols)/2) + self.padding[0]/2
+            self.y0 = y + height + self.padding[1]/2
+            Logger.debug("Cards: set scale from viewport height: origin = %d %d" % (self.x0,self.y0))
         else:
             w = width/self.num_cols - self.padding[0]
             csize = self._set_cell_size(w, int(w*Card.aspect_ratio))
-            self.x0 = self.padding[0]/2
-            self.y0 = height + self.padding[1]/2
-            Logger.debug("Cards: set scale from window width: origin = %d %d" % (self.x0,self.y0))
+            self.x0 = x + self.padding[0]/2
+            self.y0 = y + height + self.padding[1]/2
+            Logger.debug("Cards: set scale from viewport width: origin = %d %d" % (self.x0,self.y0))
         Logger.info("Cards: card size = %d x %d" % self.card_size)
         self.fan_pile = int(self.fan_pile_scale*self.card_size[1])
         Logger.info("Cards: fan pile =  %d" % self.fan_pile)
+        self.counter_size = 0.03*width, 0.03*height
 
     def _set_cell_size(self, w, h):
         self.card_size = (w, h)
@@ -71,9 +158,13 @@ class BaseGame(object):
 
     # convert from column and row to screen coords
     def position_pile(self, pile): 
+        if not self.layout:
+            pile.x = pile.y = pile.xstep = pile.ystep = 0
+            pile.csize = (0, 0)
+            return
         pile.x = self.x0 + pile.col*(self.card_size[0]+self.padding[0])
         pile.y = self.y0 - (pile.row+1)*(self.card_size[1]+self.padding[1])
-        Logger.debug("Cards: position pile %s @ %dx%d" % (pile, pile.x, pile.y))
+        self.trace('position_pile', pile.type, pile.index, pile.x, pile.y)
         pile.xstep = self.fan_pile if pile.fan == 'right' else 0
         pile.ystep = self.fan_pile if pile.fan == 'down' else 0
         pile.csize = self.card_size
@@ -87,47 +178,108 @@ class BaseGame(object):
 
     def all_piles(self): return self.piles['tableau']+self.piles['foundation']+self.piles['waste']
 
-    # abstract methods
+    def num_piles_added(self): return sum([len(group) for group in self.piles.values()])
+
+    # can we add num cards from group to pile?
     def can_add(self, src, pile, group, num):
-        raise NotImplementedError("can_add must be implemented")
+        rule = self.rules.get(pile.type)
+        if rule is None or not rule.allows(src, num):
+            return False
+        top = pile.top_card()
+        if top is None:
+            return self.can_start(pile, rule, group[0])
+        return rule.table[top.id][group[0].id]
+
+    # can card be put on an empty pile?
+    def can_start(self, pile, rule, card):
+        if pile.suit and card.suit != pile.suit:
+            return False
+        return rule.base is None or card.rank == rule.base
 
+    # can we pick up this card together with the given group
     def can_join(self, pile, card):
-        return True
+        rule = self.joins.get(pile.type)
+        return rule is None or rule.table[pile.top_card().id][card.id]
 
     def on_moved(self, move):
         pass
 
+    # list of (orig, dest, num) for each move which can be made - only the top card can be
+    # moved from the foundations
+    def legal_moves(self):
+        moves = []
+        for orig in self.all_piles():
+            top = orig.top_card()
+            if top is None or not top.faceup: continue
+            maxnum = 1 if orig.type == 'foundation' else orig.movable()
+            for num in range(1, maxnum+1):
+                group = orig.stack[-num:]
+                for dest in self.all_piles():
+                    if dest is not orig and self.can_add(orig, dest, group, num):
+                        moves.append((orig, dest, num))
+        return moves
+
+    # canonical key for the position - piles of the types in symmetric can be swapped
+    # with each other without changing it
+    def state_key(self):
+        key = 0
+        symmetric = self.symmetric_piles()
+        for type in PILE_TYPES:
+            key ^= self.swap_hash[type] if type in symmetric else self.type_hash[type]
+        return key
+
+    # add pile to the board hashes if sign is 1, or take it out if sign is -1
+    def add_hash(self, pile, sign):
+        value = mix(pile.hash, pile.slot)
+        self.hash ^= value
+        self.type_hash[pile.type] ^= value
+        self.swap_hash[pile.type] = (self.swap_hash[pile.type] + sign*mix(pile.hash, SWAP_SLOTS[pile.type])) & MASK
+
+    def symmetric_piles(self):
+        return self.symmetric
+
+    # no. of times we have been in the current position
+    def repeats(self):
+        return self.seen.get(self.state_key(), 0)
+
+    # forget one visit to a position when a move is undone
+    def unsee(self, key):
+        count = self.seen.get(key, 0)
+        if count > 1:
+            self.seen[key] = count-1
+        else:
+            self.seen.pop(key, None)
+
     # add a new pile 
     def add_pile(self, pile):
         pile.index = len(self.piles[pile.type])
+        pile.slot = self.num_piles_added()
         pile.on_release = lambda auto=False: self.on_release(pile, auto)
         self.piles[pile.type].append(pile)
 
     # can we move num cards from orig to dest?
     def try_move(self, orig, dest, num, callback=False, collide=False):
         if dest is orig: return False
-        Logger.debug("Cards: try_move %d from %r to %r" % (num, orig.pid(), dest.pid()))
-        group = orig.top()
+        # only a face up group which can be picked up together - and one card from the foundations
+        if num < 1 or num > (1 if orig.type == 'foundation' else orig.movable()): return False
+        self.trace('try_move', num, orig.pid(), dest.pid())
         if collide:
             if dest.ystep > 0 and dest.size() > 0:
                 target = dest.top()
             else:
                 target = dest.base()
-            if not group.collide_widget(target):
+            if not orig.top().collide_widget(target):
                 return False
-        if self.can_add(orig, dest, group, num):
+        if self.can_add(orig, dest, orig.stack[-num:], num):
             # split flag is set if a new card was *not* uncovered
-            is_split = group.cards() > num
-            if not is_split and orig.size() > 1:
-                if orig.next().top_card().faceup:
-                    is_split = True
+            is_split = orig.size() > num and orig.stack[-num-1].faceup
             self.move(orig, dest, num, split=is_split, callback=callback)
             return True
         return False
 
     # callback on card drag released - returns cards moved or None if no move
     def on_release(self, pile, auto=False):
-        Logger.debug("Cards: on_release %s %d auto=%s" % (pile.type, pile.index, auto))
+        self.trace('on_release', pile.type, pile.index, auto)
         top = pile.top()
         if top.cards() == 0 or top.top_card() is None: return False
         #Logger.debug("Cards: %d cards released top=%s bot=%s" % 
@@ -141,16 +293,23 @@ class BaseGame(object):
             for dest in self.foundation() + self.tableau() + self.waste():
                 if self.try_move(pile, dest, top.cards(), collide=True):
                     return top
-        Logger.debug("Cards: move back")
+        self.trace('move_back')
         pile.move_cards_back()
         return None
    
-    # check for any cards which can be moved to foundations
+    # move any cards we can to the foundations
     def auto_drop(self):
+        moved = False
+        while self.drop_card():
+            moved = True
+        return moved
+
+    # check for a card which can be moved to foundations
+    def drop_card(self):
         for orig in self.tableau() + self.waste():
-            if orig.size() > 0 and orig.top().top_card().faceup:
+            if orig.size() > 0 and orig.top_card().faceup:
                 for dest in self.foundation():
-                    if self.try_move(orig, dest, 1, callback=self.auto_drop):
+                    if self.try_move(orig, dest, 1, callback=None):
                         return True
         return False
 
@@ -169,20 +328,35 @@ class BaseGame(object):
         if move['dst'][0] == 'foundation': score = num
         if move['src'][0] == 'foundation': score = -num
         # move from src to dst
-        Logger.debug("Cards: do_move %r" % move)
+        self.trace('do_move', move)
         src, dst = move['src'], move['dst']
         orig = self.piles[src[0]][src[1]]
         dest = self.piles[dst[0]][dst[1]]
-        orig.move_num_cards_to(dest, num, 'expose' in move, 'cover' in move, 'flip' in move)
-        # any items we exposed should now be movable
-        if orig.size() > 0 and orig.top().top_card() and orig.top().top_card().faceup:
-            orig.top().lock(False)
+        sizes = orig.size(), dest.size()
+        if reverse:
+            self.unsee(self.state_key())
+        self.add_hash(orig, -1)
+        self.add_hash(dest, -1)
+        orig.move_cards_to(dest, num, 'expose' in move, 'cover' in move, 'flip' in move)
+        self.add_hash(orig, 1)
+        self.add_hash(dest, 1)
+        self.count(orig, sizes[0])
+        self.count(dest, sizes[1])
+        if not reverse:
+            key = self.state_key()
+            self.seen[key] = self.seen.get(key, 0) + 1
         return orig, dest, score
 
+    # default move handler if there is no app - moves are applied straight away
+    def play(self, orig, dest, num, callback=False, **args):
+        args.update(src=orig.pid(), dst=dest.pid(), n=num)
+        self.do_move(args)
+        self.on_moved(args)
+        if callback: callback()
+
     # deal top card from src to each of dest list of piles
     def deal_cards(self, src, dest, append=False):
-        if src.size() > 0 and len(dest) > 0:
-            cb = partial(self.deal_cards, src, dest[1:], True)
-            self.move(src, dest[0], 1, flip=True, append=append, callback=cb)
+        for i, pile in enumerate(dest[:src.size()]):
+            self.move(src, pile, 1, flip=True, append=append or i > 0, callback=None)
 
 
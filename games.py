@@ -1,8 +1,8 @@
 from functools import partial
-from kivy.logger import Logger
 from cards import Deck
 from pile import Foundation, Tableau, Waste
 from game import BaseGame
+from rules import Rule
 
 
 class Yukon(BaseGame):
@@ -22,6 +22,11 @@ Cards can also be moved back from the foundations.
     tableau_pos = 0
     foundation_pos = [(7,i) for i in range(4)]
     tableau_depth = [(0,1)] + [(i,5) for i in range(1,7)]
+    rules = dict(
+        # foundation builds by suit from ace
+        foundation = Rule('suit', base=Deck.ace, max_cards=1),
+        # tableau builds down by alternate color from king
+        tableau = Rule('alt_color', order=-1, base=Deck.king))
 
     # setup the initial game layout
     def build(self):
@@ -38,15 +43,6 @@ Cards can also be moved back from the foundations.
             for i in range(self.tableau_depth[pile.index][1]):
                 pile.add_card(deck.next(True))
 
-    # can we add num cards from group to pile?
-    def can_add(self, src, pile, group, num):
-        if pile.type == 'foundation':
-            # foundation builds by suit from ace
-            return num == 1 and pile.by_rank(group.top_card(), base=Deck.ace, suit=pile.suit)
-        elif pile.type == 'tableau':
-            # tableau builds down by alternate color from king
-            return pile.by_alt_color(group.bottom_card(), base=Deck.king, order=-1)
-
 
 class Klondike(Yukon):
     name = 'Klondike'
@@ -85,13 +81,13 @@ Touch the deck at top left to deal onto the waste or to redeal the pack if empty
 
     # callback to deal next 3 cards
     def deal_next(self):
-        Logger.debug("Cards: deal")
+        self.trace('deal', 'pack')
         pile, waste = self.waste()
         if pile.size() > 0:
             self.move(pile, waste, min(self.deal_by, pile.size()), flip=True)
         else:
             num = waste.size()
-            Logger.debug("Cards: pick up %d cards from waste" % num)
+            self.trace('deal', 'waste')
             self.move(waste, pile, num, flip=True, append=True)
 
     # auto-deal onto empty waste pile
@@ -121,6 +117,14 @@ The tableau piles build down by alternate colour. The number of cards which can
     num_waste = 4
     num_cols = 9
     num_rows = 4.7
+    rules = dict(
+        # free cells take one card
+        waste = Rule('none', max_cards=1),
+        # build by suit on foundations
+        foundation = Rule('suit', base=Deck.ace, max_cards=1),
+        # build down by alternate colour on tableau
+        tableau = Rule('alt_color', order=-1))
+    joins = dict(tableau = Rule('alt_color', order=-1))
 
     # setup the initial game layout
     def build(self):
@@ -138,28 +142,24 @@ The tableau piles build down by alternate colour. The number of cards which can
             for _ in range(depth):
                  pile.add_card(deck.next(True))
 
-    # limit number of cards moved to number of free cells
+    # no. of empty free cells
     def free_cells(self):
-        return sum([1 for p in self.waste() if p.size() == 0])
+        return self.empty_waste
+
+    # limit number of cards moved by number of free cells and empty tableau piles
+    # each empty pile doubles the number we can move, unless we are moving to it
+    def max_move(self, pile):
+        spaces = self.empty_tableau - (1 if pile.size() == 0 else 0)
+        return (self.free_cells()+1) << spaces
+
+    # free cells are interchangeable as well as tableau piles
+    symmetric = ['tableau', 'waste']
 
     # can we add num cards from group to pile?
     def can_add(self, src, pile, group, num):
-        if pile.type == 'waste':
-            # free cells take one card
-            return num == 1 and pile.size() == 0
-        elif pile.type == 'foundation':
-            # build by suit on foundations
-            return num == 1 and pile.by_rank(group.top_card(), base=Deck.ace, suit=pile.suit)
-        elif pile.type == 'tableau':
-            # build down by alternate colour on tableau
-            return num <= self.free_cells()+1 and pile.by_alt_color(group.bottom_card(), order=-1)
- 
-    # can we pick up this card together with the given group
-    def can_join(self, pile, card):
-        if pile.type == 'tableau':
-            return pile.by_alt_color(card, order=-1)
-        else:
-            return True
+        if pile.type == 'tableau' and num > self.max_move(pile):
+            return False
+        return super(FreeCell, self).can_add(src, pile, group, num)
 
 
 class Gypsy(BaseGame):
@@ -182,6 +182,12 @@ Touch the deck at bottom right to deal a new card onto each of the tableau piles
     waste_pos = [(8.5,4)]
     tableau_depth = [3] * 8
     waste_depth = [80]
+    rules = dict(
+        # build up by suit
+        foundation = Rule('suit', base=Deck.ace, max_cards=1),
+        # build down by alternate colour, anything on space
+        tableau = Rule('alt_color', order=-1))
+    joins = dict(tableau = Rule('alt_color', order=-1))
 
     # setup the initial game layout
     def build(self):
@@ -202,28 +208,15 @@ Touch the deck at bottom right to deal a new card onto each of the tableau piles
             for _ in range(self.waste_depth[pile.index]):
                 pile.add_card(deck.next())
 
-    # can we add num cards from group to pile?
-    def can_add(self, src, pile, group, num):
-        if pile.type == 'foundation':
-            # build up by suit
-            return num == 1 and pile.by_rank(group.top_card(), base=Deck.ace, suit=pile.suit)
-        elif pile.type == 'tableau':
-            # build down by alternate colour, anything on space
-            return pile.by_alt_color(group.bottom_card(), order=-1)
-        return False
-
-    # can we pick up this card together with the given group
-    def can_join(self, pile, card):
-        if pile.type == 'tableau':
-            return pile.by_alt_color(card, order=-1)
-        else:
-            return True
-
     # deal cards from waste onto tableau
     def deal_next(self):
-        Logger.debug("Cards: deal to tableau")
+        self.trace('deal', 'pack')
         self.deal_cards(self.waste()[0], self.tableau())
 
+    # tableau piles are dealt to in order, so can only be swapped once the pack is empty
+    def symmetric_piles(self):
+        return self.symmetric if self.waste()[0].size() == 0 else []
+
 
 class Hypotenuse(Gypsy):
     name = 'Hypotenuse'
@@ -237,13 +230,11 @@ Similar to Gypsy, but only Kings on empty spaces.
     waste_pos = [(0,0)]
     waste_depth = [49]
 
-    # as per Gypsy but only Kings on empty tableau piles
-    def can_add(self, src, pile, group, num):
-        if pile.type == 'foundation':
-            return num == 1 and pile.by_rank(group.top_card(), base=Deck.ace, suit=pile.suit)
-        elif pile.type == 'tableau':
-            return pile.by_alt_color(group.bottom_card(), order=-1, base=Deck.king)
-        return False
+    rules = dict(
+        # build up by suit
+        foundation = Rule('suit', base=Deck.ace, max_cards=1),
+        # as per Gypsy but only Kings on empty tableau piles
+        tableau = Rule('alt_color', order=-1, base=Deck.king))
 
 
 class Crossroads(Gypsy):
@@ -273,9 +264,13 @@ Similar to Gypsy, but a lot harder.
     def deal_next(self, append=False, callback=False):
         pile, waste = self.waste()
         if pile.size() > 0:
-            Logger.debug("Cards: deal from pack")
+            self.trace('deal', 'pack')
             self.move(pile, waste, 1, flip=True, append=append, callback=callback)
 
+    # cards are dealt to the waste so tableau piles can always be swapped
+    def symmetric_piles(self):
+        return self.symmetric
+
 
 class Spider(BaseGame):
     name = 'Spider'
@@ -293,6 +288,17 @@ Touch the deck at top left to deal a new card onto each of the tableau piles.
     num_rows = 5
     y_padding = 0.01
     tableau_depth = [6,5,5,6,5,5,6,5,5,6]
+    rules = dict(
+        # whole pack from king down is moved to an empty foundation
+        foundation = Rule('none', base=Deck.king, sources=['tableau']),
+        # build down by rank, any suit, anything on empty pile, no move back from foundation
+        tableau = Rule('rank', order=-1, sources=['tableau']))
+    # can only pickup groups by suit
+    joins = dict(tableau = Rule('suit', order=-1))
+    # move a completed suit to the foundations as soon as it is built, as in the usual rules -
+    # if not set it is left for the auto drop button
+    auto_complete = True
+    options = ['auto_complete']
 
     # setup the initial game layout
     def build(self):
@@ -313,35 +319,45 @@ Touch the deck at top left to deal a new card onto each of the tableau piles.
             for _ in range(num):
                  pile.add_card(deck.next())
 
-    # auto drop disabled
-    def auto_drop(self):
+    # only completed suits can be dropped
+    def drop_card(self):
+        for pile in self.tableau():
+            if pile.suit_run() >= 13:
+                for dest in self.foundation():
+                    if dest.size() == 0:
+                        return self.try_move(pile, dest, 13, callback=None)
         return False
 
     # can we add num cards from group to pile?
     def can_add(self, src, pile, group, num):
-        if pile.type == 'foundation':
+        if pile.type == 'foundation' and (num != 13 or src.suit_run() < 13):
             # can only move whole pack to foundation
-            return num == 13
-        elif pile.type == 'tableau' and src.type == 'tableau':
-            # build down by rank, any suit, anything on empty pile, no move back from foundation
-            return pile.by_rank(group.bottom_card(), order=-1)
-        return False
+            return False
+        return super(Spider, self).can_add(src, pile, group, num)
 
-    # can only pickup groups by suit
-    def can_join(self, pile, card):
-        if pile.type == 'tableau':
-            return pile.by_rank(card, order=-1, suit=pile.top().top_card().suit)
-        else:
-            return True
+    # move a completed suit straight to the foundations
+    def on_moved(self, move):
+        if not self.auto_complete: return
+        pile = self.piles[move['dst'][0]][move['dst'][1]]
+        if pile.type == 'tableau' and pile.suit_run() >= 13:
+            for dest in self.foundation():
+                if dest.size() == 0:
+                    # card under the run stays face up on undo if it already was
+                    split = pile.size() > 13 and pile.stack[-14].faceup
+                    self.move(pile, dest, 13, split=split, append=True, callback=None)
+                    return
 
     # deal cards from waste onto tableau
     def deal_next(self):
-        Logger.debug("Cards: deal spider")
+        self.trace('deal', 'pack')
         # can't deal onto empty piles
-        for i, dest in enumerate(self.tableau()):
-            if dest.size() == 0: return
+        if self.empty_tableau > 0: return
         self.deal_cards(self.waste()[0], self.tableau())
 
+    # tableau piles are dealt to in order, so can only be swapped once the pack is empty
+    def symmetric_piles(self):
+        return self.symmetric if self.waste()[0].size() == 0 else []
+
 
 class Forty(BaseGame):
     name = 'Forty Thieves'
@@ -358,6 +374,13 @@ Touch the deck at top left to deal a new card onto the waste pile if empty. Ther
     num_cols = 10
     y_padding = 0.04
     num_rows = 4.3
+    rules = dict(
+        # built on foundations by suit ascending from ace
+        foundation = Rule('suit', base=Deck.ace),
+        # build on tableau by suit descending - only one card can be moved
+        tableau = Rule('suit', order=-1))
+    # can only pick up one card at a time
+    joins = dict(tableau = Rule('none'), foundation = Rule('none'))
 
     # setup the initial game layout
     def build(self):
@@ -371,7 +394,7 @@ Touch the deck at top left to deal a new card onto the waste pile if empty. Ther
 
     # deal initial cards to given pile
     def start(self, pile, deck):
-        Logger.debug("Cards: Forty start pile %s" % pile)
+        self.trace('start_pile', pile.type, pile.index)
         if pile.type == 'tableau':
             for i in range(4):
                 pile.add_card(deck.next(True))
@@ -382,24 +405,9 @@ Touch the deck at top left to deal a new card onto the waste pile if empty. Ther
             else:
                 pile.add_card(deck.next(True))
 
-    # can only pick up one card at a time
-    def can_join(self, pile, card):
-        return False
-
-    # can we add num cards from group to pile?
-    def can_add(self, src, pile, group, num):
-        if pile.type == 'foundation':
-            # built on foundations by suit ascending from ace
-            return pile.by_rank(group.top_card(), base=Deck.ace, suit=pile.suit)
-        elif pile.type == 'tableau':
-            # build on tableau by suit descending - only one card can be moved
-            suit = pile.top().top_card().suit if pile.size() else None
-            return pile.by_rank(group.top_card(), order=-1, suit=suit)
-        return False
-
     # callback to deal next card - no redeal
     def deal_next(self):
-        Logger.debug("Cards: deal forty")
+        self.trace('deal', 'pack')
         pile, waste = self.waste()
         if pile.size() > 0:
             self.move(pile, waste, 1, flip=True)
@@ -427,6 +435,13 @@ The reserve of 11 cards can only be played onto the foundation piles. Cards can
     num_rows = 5
     y_padding = 0.01
     foundation_suit = [''] * 8
+    rules = dict(
+        # build up by alternate colour, ace on king from base rank we selected
+        foundation = Rule('alt_color', wrap=True, sources=['tableau', 'waste']),
+        # build down by alternate colour, king on ace, anything on space
+        tableau = Rule('alt_color', order=-1, wrap=True, sources=['tableau', 'waste']))
+    # can only pick up one card at a time
+    joins = dict(tableau = Rule('none'), foundation = Rule('none'))
 
     # setup the initial game layout
     def build(self):
@@ -450,39 +465,32 @@ The reserve of 11 cards can only be played onto the foundation piles. Cards can
                 for _ in range(89):
                     pile.add_card(deck.next())
 
-    # can only pick up one card at a time
-    def can_join(self, pile, card):
-        return False
-
     # base of foundation piles
     def base_rank(self):
-        for pile in self.foundation():
-            if pile.size() > 0:
-                return pile.bottom().bottom_card().rank
-        return 0
+        return self.base
 
     # can we add num cards from group to pile?
     def can_add(self, src, pile, group, num):
-        card = group.top_card()
-        reserve = self.waste()[0]
-        base = self.base_rank()
-        if base == 0:
+        if self.base == 0:
             # first move must be from tableau to foundation
-            return src.type == 'tableau' and pile.type == 'foundation'
-        elif src.type != 'foundation':
-            if pile.type == 'foundation':
-                # build up by alternate colour, ace on king from base rank we selected
-                return pile.by_alt_color(card, base=base, wrap=True)
-            elif pile.type == 'tableau' and src is not reserve:
-                # build down by alternate colour, king on ace, anything on space
-                return pile.by_alt_color(card, order=-1, wrap=True)
-        return False
+            if src.type != 'tableau' or pile.type != 'foundation': return False
+        elif src is self.waste()[0] and pile.type != 'foundation':
+            # reserve can only be played to the foundations
+            return False
+        return super(Terrace, self).can_add(src, pile, group, num)
+
+    # foundations start from the base rank, which is set by the first card played
+    def can_start(self, pile, rule, card):
+        if pile.type == 'foundation':
+            if pile.suit and card.suit != pile.suit: return False
+            return self.base == 0 or card.rank == self.base
+        return True
 
     # deal one card from pile onto waste
     def deal_next(self, append=False, callback=False):
         pile, waste = self.waste()[1:]
         if pile.size() > 0 and self.base_rank() > 0:
-            Logger.debug("Cards: terrace -> deal from pack")
+            self.trace('deal', 'pack')
             self.move(pile, waste, 1, flip=True, append=append, callback=callback)
 
     # refill waste from deck if empty and if any of the tableau piles are empty fill from waste
@@ -492,10 +500,10 @@ The reserve of 11 cards can only be played onto the foundation piles. Cards can
         if self.base_rank() == 0 or pile.size() == 0: return
         if waste.size() == 0:
             self.deal_next(True, None)
-        else:
+        elif self.empty_tableau > 0:
             for pile in self.tableau():
                 if pile.size() == 0:
-                    Logger.debug("Cards: deal to empty tableau pile %d" % pile.index)
+                    self.trace('refill', pile.index)
                     self.move(waste, pile, 1, append=True, callback=None)
                     return
 
@@ -507,22 +515,9 @@ General's Patience is a varient of Terrace. Rules are the same except that found
     """
     foundation_suit = Deck.suits * 2
 
-    # like terrace but foundations build by suit
-    # can we add num cards from group to pile?
-    def can_add(self, src, pile, group, num):
-        card = group.top_card()
-        reserve = self.waste()[0]
-        base = self.base_rank()
-        if base == 0:
-            # first move must be from tableau to foundation
-            return src.type == 'tableau' and pile.type == 'foundation' and pile.suit == group.top_card().suit
-        elif src.type != 'foundation':
-            if pile.type == 'foundation':
-                # build up by alternate colour, ace on king from base rank we selected
-                return pile.by_rank(card, base=base, suit=pile.suit, wrap=True)
-            elif pile.type == 'tableau' and src is not reserve:
-                # build down by alternate colour, king on ace, anything on space
-                return pile.by_alt_color(card, order=-1, wrap=True)
-        return False
-
+    rules = dict(
+        # like terrace but foundations build up by suit
+        foundation = Rule('suit', wrap=True, sources=['tableau', 'waste']),
+        # build down by alternate colour as in terrace
+        tableau = Rule('alt_color', order=-1, wrap=True, sources=['tableau', 'waste']))
 
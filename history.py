@@ -0,0 +1,89 @@
+import sqlite3
+import time
+from kivy.logger import Logger
+
+# record of every game played, in an sqlite database - each game is added to the games
+# table, and the totals for the game and a count of won games by no. of moves are updated
+# in the same transaction so stats are read back without scanning the games table
+class History(object):
+    schema = '''
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY, variant TEXT NOT NULL, deal INTEGER, finished REAL,
+            duration REAL, moves INTEGER, score INTEGER, won INTEGER);
+        CREATE INDEX IF NOT EXISTS games_variant ON games (variant, id);
+        CREATE INDEX IF NOT EXISTS games_deal ON games (variant, deal);
+        CREATE TABLE IF NOT EXISTS totals (
+            variant TEXT PRIMARY KEY, played INTEGER DEFAULT 0, won INTEGER DEFAULT 0,
+            won_moves INTEGER DEFAULT 0, best_moves INTEGER DEFAULT 0, best_time REAL DEFAULT 0,
+            streak INTEGER DEFAULT 0, best_streak INTEGER DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS won_moves (
+            variant TEXT, moves INTEGER, count INTEGER DEFAULT 0, PRIMARY KEY (variant, moves));
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(self.schema)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    # add a finished or abandoned game
+    def add(self, variant, deal, moves, score, duration, won):
+        Logger.info("Cards: history add %s deal=%s moves=%d score=%d won=%s" %
+                    (variant, deal, moves, score, won))
+        with self.db:
+            self.db.execute('INSERT INTO games (variant, deal, finished, duration, moves, score, won) '
+                            'VALUES (?,?,?,?,?,?,?)',
+                            (variant, deal, time.time(), duration, moves, score, int(won)))
+            self.db.execute('INSERT OR IGNORE INTO totals (variant) VALUES (?)', (variant,))
+            if won:
+                self.db.execute('''UPDATE totals SET played=played+1, won=won+1, won_moves=won_moves+?,
+                        best_moves=CASE WHEN best_moves=0 OR ?<best_moves THEN ? ELSE best_moves END,
+                        best_time=CASE WHEN best_time=0 OR ?<best_time THEN ? ELSE best_time END,
+                        streak=streak+1, best_streak=MAX(best_streak, streak+1)
+                        WHERE variant=?''', (moves, moves, moves, duration, duration, variant))
+                self.db.execute('INSERT OR IGNORE INTO won_moves (variant, moves) VALUES (?,?)',
+                                (variant, moves))
+                self.db.execute('UPDATE won_moves SET count=count+1 WHERE variant=? AND moves=?',
+                                (variant, moves))
+            else:
+                self.db.execute('UPDATE totals SET played=played+1, streak=0 WHERE variant=?', (variant,))
+
+    # start the totals from stats kept before the history was added - ignored if any
+    # games have been recorded already
+    def import_totals(self, variant, played, won, best_moves, avg_moves):
+        with self.db:
+            self.db.execute('INSERT OR IGNORE INTO totals (variant, played, won, won_moves, best_moves) '
+                            'VALUES (?,?,?,?,?)', (variant, played, won, int(avg_moves*won), best_moves))
+
+    def has_totals(self, variant):
+        return self.db.execute('SELECT 1 FROM totals WHERE variant=?', (variant,)).fetchone() is not None
+
+    # totals for variant, with median and 90th percentile of moves to win from the won_moves
+    # counts - the no. of rows read depends on the range of moves, not the no. of games
+    def summary(self, variant):
+        row = self.db.execute('SELECT played, won, won_moves, best_moves, best_time, streak, best_streak '
+                              'FROM totals WHERE variant=?', (variant,)).fetchone()
+        played, won, won_moves, best_moves, best_time, streak, best_streak = row or (0,)*7
+        counts = self.db.execute('SELECT moves, count FROM won_moves WHERE variant=? ORDER BY moves',
+                                 (variant,)).fetchall()
+        total = sum(n for _, n in counts)
+        percentile = {}
+        for p in (0.5, 0.9):
+            seen = 0
+            for moves, n in counts:
+                seen += n
+                if seen >= p*total:
+                    percentile[p] = moves
+                    break
+        return dict(played=played, won=won, streak=streak, best_streak=best_streak,
+                    best_moves=best_moves, best_time=best_time,
+                    avg_moves=float(won_moves)/won if won else 0.0,
+                    median_moves=percentile.get(0.5, 0), p90_moves=percentile.get(0.9, 0))
+
+    # most recent games for variant, newest first
+    def recent(self, variant, limit=10):
+        return self.db.execute('SELECT deal, finished, duration, moves, score, won FROM games '
+                               'WHERE variant=? ORDER BY id DESC LIMIT ?', (variant, limit)).fetchall()
@@ -0,0 +1,146 @@
+import os
+# command line options are for building the library, not for kivy
+if __name__ == '__main__':
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+import argparse
+import bisect
+import mmap
+import multiprocessing
+import random
+import re
+import struct
+from kivy.logger import Logger
+
+from cards import Deck
+from registry import GAMES
+import solver
+
+# library of deals for a game, rated by the solver - one file per game with a header,
+# a table of buckets by verdict and difficulty level, then the records sorted by bucket
+# so a deal can be picked from any bucket without reading the rest of the file
+class DealLibrary(object):
+    magic = b'KVDL'
+    version = 1
+    verdicts = ['unknown', 'won', 'lost']
+    levels = ['easy', 'medium', 'hard']
+    header = struct.Struct('<4sII')     # magic, version, count
+    buckets = struct.Struct('<%dI' % (2*len(verdicts)*len(levels)))  # start, count for each
+    record = struct.Struct('<IBBHI')    # seed, verdict, level, solution moves, search nodes
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deals')
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.count = 0
+        self.table = [0] * (2*len(self.verdicts)*len(self.levels))
+        if os.path.exists(path) and os.path.getsize(path) > self.header.size+self.buckets.size:
+            with open(path, 'rb') as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.count = self.header.unpack_from(self.data, 0)
+            if magic != self.magic or version != self.version:
+                Logger.warning("Cards: ignoring deal library %s" % path)
+                self.close()
+            else:
+                self.table = list(self.buckets.unpack_from(self.data, self.header.size))
+
+    # file for game name
+    @classmethod
+    def path_for(cls, name, folder=None):
+        return os.path.join(folder or cls.folder, re.sub(r'\W+', '_', name.lower()) + '.deals')
+
+    def close(self):
+        if self.data: self.data.close()
+        self.data = None
+        self.count = 0
+
+    def bucket(self, verdict, level):
+        i = 2*(self.verdicts.index(verdict)*len(self.levels) + self.levels.index(level))
+        return self.table[i], self.table[i+1]
+
+    def get(self, i):
+        pos = self.header.size + self.buckets.size + i*self.record.size
+        seed, verdict, level, moves, nodes = self.record.unpack_from(self.data, pos)
+        return dict(seed=seed, verdict=self.verdicts[verdict], level=self.levels[level],
+                    moves=moves, nodes=nodes)
+
+    # random deal with given verdict, from level or any level if None - returns None if none
+    def pick(self, verdict='won', level=None, rng=random):
+        ranges = [self.bucket(verdict, l) for l in ([level] if level else self.levels)]
+        total = sum(n for _, n in ranges)
+        if total == 0: return None
+        i = rng.randrange(total)
+        for start, n in ranges:
+            if i < n: return self.get(start+i)
+            i -= n
+
+    def records(self):
+        return [self.get(i) for i in range(self.count)]
+
+    # write records to path - levels of won deals are set from the search effort to solve them
+    @classmethod
+    def write(cls, path, records):
+        won = sorted(r['nodes'] for r in records if r['verdict'] == 'won')
+        for r in records:
+            r['level'] = cls.levels[0]
+            if r['verdict'] == 'won':
+                rank = bisect.bisect_left(won, r['nodes'])
+                r['level'] = cls.levels[rank*len(cls.levels)//len(won)]
+        buckets = [(verdict, level) for verdict in cls.verdicts for level in cls.levels]
+        records = sorted(records, key=lambda r: (buckets.index((r['verdict'], r['level'])), r['seed']))
+        table = []
+        for bucket in buckets:
+            found = [i for i, r in enumerate(records) if (r['verdict'], r['level']) == bucket]
+            table += [found[0] if found else 0, len(found)]
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + '.tmp', 'wb') as f:
+            f.write(cls.header.pack(cls.magic, cls.version, len(records)))
+            f.write(cls.buckets.pack(*table))
+            for r in records:
+                f.write(cls.record.pack(r['seed'], cls.verdicts.index(r['verdict']),
+                                        cls.levels.index(r['level']), min(r['moves'], 0xffff), r['nodes']))
+        os.rename(path + '.tmp', path)
+
+
+# solve deal seed of game cls - runs in the batch tool worker processes
+def rate(args):
+    cls, seed, max_nodes = args
+    game = cls()
+    game.build()
+    deck = Deck(game.decks)
+    deck.rewind(shuffle=True, seed=seed)
+    game.deal(deck)
+    result = solver.solve(cls, game.snapshot(), max_nodes)
+    return dict(seed=seed, verdict=result['verdict'], moves=len(result['moves']), nodes=result['nodes'])
+
+
+# batch tool - solve deals for each game in parallel and add them to the library
+def build(games, count, max_nodes, folder, jobs):
+    pool = multiprocessing.Pool(jobs)
+    for cls in games:
+        path = DealLibrary.path_for(cls.name, folder)
+        library = DealLibrary(path)
+        records = library.records()
+        library.close()
+        done = set(r['seed'] for r in records)
+        start = max(done)+1 if done else 0
+        seeds = list(range(start, start+count))
+        Logger.info("Cards: rating %d %s deals from seed %d" % (count, cls.name, start))
+        for result in pool.imap_unordered(rate, [(cls, seed, max_nodes) for seed in seeds], 4):
+            records.append(result)
+        DealLibrary.write(path, records)
+        Logger.info("Cards: %s library has %d deals" % (cls.name, len(records)))
+    pool.close()
+    pool.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='build or extend the deal library')
+    parser.add_argument('games', nargs='*', help='games to rate - all if not given')
+    parser.add_argument('-n', '--count', type=int, default=100, help='no. of new deals per game')
+    parser.add_argument('--nodes', type=int, default=50000, help='solver node budget per deal')
+    parser.add_argument('--folder', default=DealLibrary.folder, help='library folder')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+    names = args.games or sorted(GAMES.keys())
+    build([GAMES[name] for name in names], args.count, args.nodes, args.folder, args.jobs)
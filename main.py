@@ -1,37 +1,34 @@
 ## simpie solitaire card game
-import ast
-from functools import partial
+import time
+START_TIME = time.time()
+import os
+from collections import OrderedDict
 
 import kivy
 kivy.require('1.11.0')
 from kivy.app import App
 from kivy.clock import Clock
+from kivy.config import Config
 from kivy.logger import Logger
-from kivy.properties import NumericProperty, ObjectProperty
+from kivy.properties import NumericProperty, ObjectProperty, StringProperty
 from kivy.core.window import Window
+from kivy.graphics import PopMatrix, PushMatrix, Scale
 from kivy.uix.label import Label
 from kivy.uix.popup import Popup
 from kivy.metrics import Metrics
 from kivy.utils import platform
 
 from cards import Deck
-from game import BaseGame
-import games
-
-GAMES = {}
-
-# load all game classes
-def get_subclasses(base):
-    cls = base.__subclasses__()
-    for d in list(cls):
-        cls.extend(get_subclasses(d))
-    return cls  
-
-def register_games():
-    global GAMES
-    for plugin in get_subclasses(BaseGame):
-        Logger.info("Cards: load game %s" % plugin.name)
-        GAMES[plugin.name] = plugin
+from anim import AnimQueue
+from cache import ResultCache
+from history import History
+from library import DealLibrary
+from profiler import Profiler
+import replay
+import solver
+from registry import GAMES
+from tracer import TRACE
+from undotree import UndoTree
 
 # main app
 class Solitaire(App):
@@ -40,25 +37,41 @@ class Solitaire(App):
     max_moves = NumericProperty(0)
     game = ObjectProperty(None)
     font_size = NumericProperty(12)
-    menu_height = NumericProperty(0.06*Window.height)
-    pad_by = NumericProperty(0.007*Window.height)
+    menu_height = NumericProperty(0)
+    pad_by = NumericProperty(0)
+    winnable = StringProperty('')
+    # no. of boards kept for switching back to recently played games
+    cached_boards = 3
+    # seconds after the last window resize event before the board is laid out again
+    settle_time = 0.25
 
     # initialise config file
     def build_config(self, config):
         #self.games = games.register()
-        names = sorted(GAMES.keys())
-        config.setdefaults('game', {'name': names[0], 'score': 0, 'won':False})
-        config.setdefaults('moves', {'count': 0, 'max': 0})
+        names = GAMES.keys()
+        config.setdefaults('game', {'name': names[0], 'score': 0, 'won':False, 'deal': '', 'time': 0})
         config.setdefaults('piles', {})
-        config.setdefaults('settings', {'fps': 10, 'font_size': 16, 'help_font_size': 14, 
-            'popup_width': 0.4, 'popup_height': 0.6})
+        config.setdefaults('settings', {'animate': 1, 'move_time': 0.15, 'font_size': 16, 
+            'help_font_size': 14, 'popup_width': 0.4, 'popup_height': 0.6, 'solver_cache': 10000,
+            'solver_nodes': 50000, 'solver_time': 2.0, 'deals': 'random', 'profile': 'off', 'replays': 0,
+            'auto_complete': 1})
 
     # settings panel
     def build_settings(self, settings):
         settings.add_json_panel('Solitaire', self.config, data='''[
-            { "type": "numeric", "title": "FPS",
-              "desc": "animation frames per second",
-              "section": "settings", "key": "fps" },
+            { "type": "options", "title": "Deals",
+              "desc": "random shuffle, or a deal from the library which is known to be winnable",
+              "section": "settings", "key": "deals",
+              "options": ["random", "winnable", "easy", "medium", "hard"] },
+            { "type": "bool", "title": "Complete suits",
+              "desc": "move a completed suit in Spider to the foundations straight away - if off use auto drop",
+              "section": "settings", "key": "auto_complete" },
+            { "type": "bool", "title": "Animate",
+              "desc": "slide cards into place - if off moves are shown instantly",
+              "section": "settings", "key": "animate" },
+            { "type": "numeric", "title": "Move time",
+              "desc": "seconds for each card to slide into place",
+              "section": "settings", "key": "move_time" },
             { "type": "numeric", "title": "Font size",
               "desc": "size of font for main screen",
               "section": "settings", "key": "font_size" },
@@ -70,73 +83,159 @@ class Solitaire(App):
               "section": "settings", "key": "popup_width" },
             { "type": "numeric", "title": "Popup height",
               "desc": "height of popup as fraction of screen",
-              "section": "settings", "key": "popup_height" }
+              "section": "settings", "key": "popup_height" },
+            { "type": "options", "title": "Profile",
+              "desc": "time moves and frames, with the results shown over the board if set to overlay",
+              "section": "settings", "key": "profile",
+              "options": ["off", "record", "overlay"] },
+            { "type": "numeric", "title": "Replays",
+              "desc": "no. of finished games to keep a replay of - 0 to not save them",
+              "section": "settings", "key": "replays" }
         ]''')
 
     # user updated config 
     def on_config_change(self, config, section, key, value):
         if config is self.config and section == 'settings' and key == 'font_size':
             self.font_size = int(value)
-
-    # initialise new game
+        if config is self.config and section == 'settings' and key in ('animate', 'move_time'):
+            self.anim.duration = self.move_time()
+        if config is self.config and section == 'settings' and key == 'profile':
+            self.set_profiling(value)
+        if config is self.config and section == 'settings' and key in self.game.options:
+            self.set_options()
+
+    # initialise new game - the board is reused if the game was played recently
     def set_game(self, name):
-        self.game = GAMES[name](root=self.root, on_move=self.on_move, menu_size=self.menu_height)
-        self.game.build()
+        if name in self.boards:
+            Logger.info("Cards: reuse board for %s" % name)
+            self.game = self.boards.pop(name)
+            self.game.attach()
+            self.game.do_resize(self.viewport())
+        else:
+            self.game = GAMES[name](root=self.root, on_move=self.on_move, viewport=self.viewport())
+            self.game.build()
+        self.set_options()
         conf = self.config
-        if not conf.has_section(name):
-            conf.add_section(name)
-            conf.set(name, 'played', 1)
-            conf.set(name, 'won', 0)
-            conf.set(name, 'best_moves', 0)
-            conf.set(name, 'avg_moves', 0)
-        conf.write()
+        # stats used to be kept in the config file
+        if conf.has_section(name) and not self.history.has_totals(name):
+            self.history.import_totals(name, conf.getint(name, 'played'), conf.getint(name, 'won'),
+                                       conf.getint(name, 'best_moves'), conf.getfloat(name, 'avg_moves'))
  
+    # game settings from the config
+    def set_options(self):
+        for key in self.game.options:
+            setattr(self.game, key, self.config.getboolean('settings', key))
+
     # shuffle the deck
     def shuffle(self):
         self.deck = Deck(self.game.decks)
-        self.deck.rewind(shuffle=True)
+        deal = self.pick_deal()
+        self.deck.rewind(shuffle=True, seed=deal['seed'] if deal else None)
         self.deck.save(self.config)
         self.config.set('game', 'won', False)
-        if self.moves > 0:
-            self.config.set(self.game.name, 'played', self.getval('played')+1)
-        self.set_moves(0, True)
+        self.config.set('game', 'deal', deal['seed'] if deal else '')
+        self.set_play_time(0)
+        self.set_moves(reset=True)
          
+    # get winnable deal from the library if set in config, or None for a random one
+    def pick_deal(self):
+        choice = self.config.get('settings', 'deals')
+        if choice == 'random': return None
+        library = DealLibrary(DealLibrary.path_for(self.game.name))
+        deal = library.pick('won', None if choice == 'winnable' else choice)
+        library.close()
+        Logger.info("Cards: %s deal from library = %s" % (choice, deal))
+        return deal
+
     # initialise the board
     def build(self):
         self.icon = 'icon.png'
         conf = self.config
+        TRACE.install(self.user_data_dir)
         name = conf.get('game', 'name')
         self.font_size = conf.getint('settings', 'font_size')
         Logger.info("Cards: build game %s font size %d" % (name, self.font_size))
+        self.anim = AnimQueue(self.move_time())
+        self.set_window_size(Window.width, Window.height)
+        self.cache = ResultCache(os.path.join(self.user_data_dir, 'solver'),
+                                 conf.getint('settings', 'solver_cache'))
+        self.analyser = solver.Analyser(self.on_analysed, conf.getint('settings', 'solver_nodes'),
+                                        self.cache, conf.getfloat('settings', 'solver_time'))
+        self.analyse_event = Clock.create_trigger(self.do_analyse, self.settle_time)
+        self.history = History(os.path.join(self.user_data_dir, 'history.db'))
+        self.set_play_time(conf.getfloat('game', 'time'))
+        self.boards = OrderedDict()
+        self.tree = UndoTree(conf)
+        self.root.bind(on_touch_down=self.on_touch)
         chooser = self.root.chooser
-        chooser.values = sorted(GAMES.keys())
-        if not name in list(GAMES.keys()):
-            name = sorted(GAMES.keys())[0]
+        if not name in GAMES:
+            name = GAMES.keys()[0]
         chooser.text = name
-        chooser.bind(text=self.choose)
+        chooser.bind(text=self.choose, on_press=self.fill_chooser)
         self.set_game(name)
-        self._starting = False
         if conf.has_option('game', 'deck'):
             # restore where we left off
             self.deck = Deck(self.game.decks, config=conf)
-            self.moves = conf.getint('moves', 'count')
-            self.max_moves = conf.getint('moves', 'max')
+            self.tree.load()
+            self.set_moves()
             self.score = conf.getint('game', 'score')
             for pile in self.game.all_piles():
                 pile.load(conf)
+            self.game.recount()
+            self.analyse()
         else:
             # first time initialisation
             self.shuffle()
+            self.game.deal(self.deck)
             for pile in self.game.all_piles():
-                self.game.start(pile, self.deck)
+                pile.sync()
                 pile.save(conf)
             conf.write()
+            self.analyse()
         if platform == 'android':
             Window.bind(on_keyboard=self.hook_keyboard)
         Window.on_resize = self.resize
-        delay = self.framerate();
-        Logger.info("Cards: resize delay = %g", delay)
-        self.resize_event = Clock.create_trigger(lambda dt: self.game.do_resize(), delay)
+        self.resize_event = Clock.create_trigger(self.do_resize, self.settle_time)
+        self.resize_to = None
+        # the board is scaled by this while the window is being resized - the board widgets
+        # are added after the menu, so they are drawn between the menu and the end of the root
+        with self.root.menu.canvas.after:
+            PushMatrix()
+            self.board_scale = Scale(1, 1, 1)
+        with self.root.canvas.after:
+            PopMatrix()
+        Window.bind(on_flip=self.first_frame)
+        self.profiler = Profiler()
+        self.set_profiling(conf.get('settings', 'profile'))
+
+    # time the hot paths and our clock callbacks - the results are saved when it is turned off
+    def set_profiling(self, mode):
+        prof = self.profiler
+        if mode == 'off':
+            if not prof.enabled: return
+            self.dump_profile()
+            prof.disable()
+        else:
+            prof.enable([(self, 'do_resize'), (self, 'on_analysed'), (self, 'draw'), (self, 'deal')])
+            prof.show_overlay(self.root if mode == 'overlay' else None)
+        # callbacks hold on to the method so need to be set again
+        self.resize_event = Clock.create_trigger(self.do_resize, self.settle_time)
+        self.analyser.callback = self.on_analysed
+
+    def dump_profile(self):
+        path = os.path.join(self.user_data_dir, 'profile-%s.json' % time.strftime('%Y%m%d-%H%M%S'))
+        self.profiler.dump(path)
+        return path
+
+    # log startup time once the first frame is on screen
+    def first_frame(self, *args):
+        Window.unbind(on_flip=self.first_frame)
+        Logger.info("Cards: time to first frame = %.3fs" % (time.time()-START_TIME))
+
+    # game names are only added to the chooser when it is first opened
+    def fill_chooser(self, chooser):
+        if not chooser.values:
+            chooser.values = GAMES.keys()
 
     # bind android back key
     def hook_keyboard(self, window, key, *args):
@@ -144,65 +243,133 @@ class Solitaire(App):
             self.undo()
             return True
 
-    # called on window resize
+    # size the menu bar for the window, the board goes in the space above it
+    def set_window_size(self, width, height):
+        self.window_size = width, height
+        self.menu_height = 0.06*height
+        self.pad_by = 0.007*height
+
+    def viewport(self):
+        width, height = self.window_size
+        return (0, self.menu_height, width, height-self.menu_height)
+
+    # called on window resize - the board is stretched to fit straight away, and laid out
+    # again once the window has stopped changing size
     def resize(self, width, height):
+        old_width, old_height = self.window_size
+        base = self.menu_height
+        self.board_scale.origin = (0, base)
+        self.board_scale.x = float(width)/old_width
+        self.board_scale.y = float(height-base)/(old_height-base)
+        self.resize_to = width, height
         if self.resize_event.is_triggered:
             self.resize_event.cancel()
         self.resize_event()
 
-    # draws the cards on new game - animate this
-    # have some hacky logic here so this is not called while it is running
-    def start(self, index, *args):
-        if index == 0:
-            self._starting = True
-        pile = (self.game.tableau()+self.game.waste())[index]
-        self.game.start(pile, self.deck)
-        if index+1 < self.game.num_tableau + self.game.num_waste:
-            Clock.schedule_once(partial(self.start, index+1), self.framerate())
-        else:
-            for pile in self.game.all_piles():
-                pile.save(self.config)
-            self.config.write()
-            self._starting = False
+    def do_resize(self, *args):
+        self.anim.flush()
+        if self.resize_to:
+            self.set_window_size(*self.resize_to)
+            self.resize_to = None
+        self.board_scale.x = self.board_scale.y = 1
+        if self.game.do_resize(self.viewport()):
+            width, height = self.window_size
+            Config.set('graphics', 'width', width)
+            Config.set('graphics', 'height', height)
+            Config.write()
+
+    # finish any resize or animation in progress before the user interacts with the board -
+    # a triple tap on the menu bar saves the trace of recent events
+    def on_touch(self, widget, touch):
+        if self.resize_event.is_triggered:
+            self.resize_event.cancel()
+            self.do_resize()
+        self.anim.flush()
+        if touch.is_triple_tap and self.root.menu.collide_point(*touch.pos):
+            TRACE.dump()
+
+    # deals the cards on new game - the board is set up straight away and the
+    # cards are then animated into place
+    def start(self):
+        piles = self.game.tableau()+self.game.waste()
+        self.game.deal(self.deck)
+        for pile in self.game.all_piles():
+            pile.save(self.config)
+        self.config.write()
+        self.anim.extend([(self.deal, (pile,)) for pile in piles])
+        self.analyse()
+
+    # draw cards dealt onto one pile, sliding them in from the top left
+    def deal(self, pile):
+        return pile.slide_from((self.game.x0, self.game.y0), pile.sync())
  
     # callback from game chooser
     def choose(self, chooser, choice):
-        if self._starting: return
         Logger.debug("Cards: choose game %s" % choice)
+        self.anim.flush()
+        self.end_game()
         self.config.set('game', 'name', choice)
         self.config.write()
-        self.game.clear(0)
-        self.set_game(choice)
+        self.switch_game(choice)
         self.shuffle()
-        self.start(0)
+        self.start()
+
+    # put the current board aside and set up game name
+    def switch_game(self, name):
+        game = self.game
+        game.detach()
+        self.boards[game.name] = game
+        while len(self.boards) > self.cached_boards:
+            self.boards.popitem(last=False)
+        self.set_game(name)
 
     # app button callbacks
     def new_game(self):
-        if self._starting: return
         Logger.debug("Cards: new_game")
+        self.end_game()
         self.game.clear(1)
         self.shuffle()
-        self.start(0)
+        self.start()
  
+    # deal again - the lines played so far are kept and can be followed with redo
     def restart(self):
-        if self._starting: return
         Logger.debug("Cards: restart")
         self.game.clear(1)
         self.deck.rewind()
-        self.set_moves(0, True)
-        self.start(0)
+        self.tree.set_node(0)
+        self.score = 0
+        self.config.set('game', 'score', 0)
+        self.set_moves()
+        self.start()
 
     def undo(self):
-        Logger.debug("Cards: undo %d" % self.moves)
-        if self.moves > 0:
-            self.set_moves(self.moves-1)
-            self.perform_move(self.moves, reverse=True)
+        TRACE.add('undo', self.moves)
+        node = self.tree.undo()
+        if node is not None:
+            self.play_group(self.tree.group(node), reverse=True)
+            self.set_moves()
 
     def redo(self):
-        Logger.debug("Cards: redo %d of %d" % (self.moves, self.max_moves))
-        if self.moves < self.max_moves:
-            self.perform_move(self.moves)
-            self.set_moves(self.moves+1)
+        TRACE.add('redo', self.moves, self.max_moves)
+        node = self.tree.redo()
+        if node is not None:
+            self.play_group(self.tree.group(node))
+            self.set_moves()
+
+    # go to another node in the undo tree - only the moves back to where the lines split
+    # and then forward from there are made, not the whole line from the start
+    def goto(self, target):
+        up, down = self.tree.goto(target)
+        TRACE.add('goto', target, len(up), len(down))
+        for node in up:
+            self.play_group(self.tree.group(node), reverse=True)
+        for node in down:
+            self.play_group(self.tree.group(node))
+        self.set_moves()
+
+    # switch to the end of the next line which was undone
+    def branch(self):
+        self.goto(self.tree.next_line())
 
     def auto(self):
         Logger.debug("Cards: auto drop")
@@ -211,13 +378,17 @@ class Solitaire(App):
     def stats(self, title=''):
         if not title:
             title = '%s statistics' % self.game.name
+        stats = self.history.summary(self.game.name)
         data = [
             'moves', str(self.moves),
             'score', str(self.score),
-            'played', self.getval('played', 'str'),
-            'won', self.getval('won', 'str'), 
-            'best moves', self.getval('best_moves', 'str'),
-            'average moves', self.getval('avg_moves', 'str')       
+            'played', str(stats['played']),
+            'won', '%d (%d%%)' % (stats['won'], 100*stats['won']//max(stats['played'], 1)),
+            'streak', '%d (best %d)' % (stats['streak'], stats['best_streak']),
+            'best moves', str(stats['best_moves']),
+            'average moves', '%.1f' % stats['avg_moves'],
+            'median moves', str(stats['median_moves']),
+            'best time', '%d:%02d' % divmod(int(stats['best_time']), 60)
         ]
         popup = self.new_popup(title, (0.4,0.1), data, self.font_size)
         popup.open()
@@ -230,8 +401,8 @@ class Solitaire(App):
         pass
 
     def new_popup(self, title, col_width, data, font_size):
-        width = self.config.getfloat('settings','popup_width')*Window.width
-        height = self.config.getfloat('settings','popup_height')*Window.height
+        width = self.config.getfloat('settings','popup_width')*self.window_size[0]
+        height = self.config.getfloat('settings','popup_height')*self.window_size[1]
         popup = AppPopup(title=title, size=(width,height))
         columns = len(col_width)
         popup.body.cols = columns
@@ -246,32 +417,90 @@ class Solitaire(App):
         conf = self.config
         if self.score == self.game.max_score and not conf.getboolean('game','won'):
             conf.set('game', 'won', True)
-            name = self.game.name
-            won = self.getval('won')
-            best = self.getval('best_moves')
-            avg = self.getval('avg_moves', 'float')
-            conf.set(name, 'won', won+1)
-            if best == 0 or self.moves < best:
-                conf.set(name, 'best_moves', self.moves)
-            conf.set(name, 'avg_moves', (avg*won+self.moves)/(won+1))
             conf.write()
+            self.record_game(True)
             self.stats(title='congratulations - you won!')
             return True
 
-    # get value from config file
-    def getval(self, key, typ='int'):
-        if typ == 'int':
-            val = self.config.getint(self.game.name, key)
-        elif typ == 'float':
-            val = self.config.getfloat(self.game.name, key)
-        else:
-            val = self.config.get(self.game.name, key)
-        return val
+    # add the current game to the history, and save a replay of it if set in config - only
+    # the latest replays are kept
+    def record_game(self, won):
+        deal = self.config.get('game', 'deal')
+        self.history.add(self.game.name, int(deal) if deal else None, self.moves, self.score,
+                         self.play_time(), won)
+        keep = self.config.getint('settings', 'replays')
+        if keep > 0:
+            self.export_replay()
+            replay.prune(self.replay_dir(), keep)
+
+    # save the moves played so far in the current game - returns the file name
+    def export_replay(self, path=None):
+        conf = self.config
+        moves = self.tree.played()
+        deal = conf.get('game', 'deal')
+        data = replay.export(type(self.game), int(deal) if deal else None, Deck(self.game.decks, config=conf),
+                             moves, self.score, self.game.snapshot(),
+                             dict((key, getattr(self.game, key)) for key in self.game.options))
+        if path is None:
+            name = '%s-%s.replay' % (self.game.name.lower().replace(' ', '_'), time.strftime('%Y%m%d-%H%M%S'))
+            path = os.path.join(self.replay_dir(), name)
+        replay.save(path, data)
+        Logger.info("Cards: saved replay %s with %d moves" % (path, len(moves)))
+        return path
+
+    def replay_dir(self):
+        return os.path.join(self.user_data_dir, 'replays')
+
+    # load a game from a replay file - the board is set to the end of the replay and the
+    # moves can be stepped back through with undo
+    def import_replay(self, path):
+        data = replay.load(path)
+        self.anim.flush()
+        if data['game'] != self.game.name:
+            # switches game via the chooser callback
+            self.root.chooser.text = data['game']
+            self.anim.flush()
+        self.end_game()
+        conf = self.config
+        self.game.clear(1)
+        self.deck = replay.deck_for(data)
+        self.deck.save(conf)
+        conf.set('game', 'won', False)
+        conf.set('game', 'deal', '' if data['deal'] is None else data['deal'])
+        self.set_play_time(0)
+        self.set_moves(reset=True)
+        self.game.deal(self.deck)
+        for text in data['moves']:
+            move = replay.decode_move(text)
+            self.tree.add(move)
+            self.score += self.game.do_move(move)[2]
+        conf.set('game', 'score', self.score)
+        conf.set('game', 'won', self.score == self.game.max_score)
+        self.set_moves()
+        for pile in self.game.all_piles():
+            pile.sync()
+            pile.save(conf)
+        conf.write()
+        self.analyse()
+
+    # record the current game as lost if it was started and not finished
+    def end_game(self):
+        if self.moves > 0 and not self.config.getboolean('game', 'won'):
+            self.record_game(False)
 
-    # logs the history and, if callback is set then defer drawing to animate
+    # seconds spent on the current game, not counting time while the app is paused
+    def play_time(self):
+        return self.game_time + time.time() - self.timer
+
+    def set_play_time(self, elapsed):
+        self.game_time = elapsed
+        self.timer = time.time()
+
+    # logs the history and applies the move, if callback is set then animate drawing it
     def on_move(self, orig, dest, num, **args):
-        Logger.debug("Cards: on_move %d" % self.moves)
+        TRACE.add('on_move', self.moves)
         do_callback = False
+        callback = None
         if 'callback' in args:
             do_callback = args['callback'] is not False
             callback = args['callback']
@@ -279,45 +508,33 @@ class Solitaire(App):
         args['src'] = orig.pid()
         args['dst'] = dest.pid()
         args['n'] = num
-        conf = self.config
-        if args.get('append', False):
-            text = conf.get('moves', str(self.moves-1))
-            text = text[:-1] + ',' + repr(args) + ']'
-            conf.set('moves', str(self.moves-1), text)
-            conf.write()
-        else:
-            conf.set('moves', str(self.moves), '[' + repr(args) + ']')
-            self.set_moves(self.moves+1)
+        self.tree.add(args)
+        self.set_moves()
         # do it
-        if do_callback:
-            Clock.schedule_once(partial(self.draw, args, callback), self.framerate())
-        else:
-            self.do_move(args)
-
-    # draw move from timer event
-    def draw(self, move, callback, *args):
-        self.do_move(move)
+        self.do_move(args, animate=do_callback)
         if callback: callback()
 
-    # read move from config and execute it
-    def perform_move(self, count, reverse=False):
-        text = self.config.get('moves', str(count))
-        Logger.debug("Cards: perform_move %d" % count)
-        moves = ast.literal_eval(text)
+    # update the piles on screen from animation queue - if animate is set then slide the cards into place
+    def draw(self, orig, dest, animate=True):
+        orig.sync()
+        num = dest.sync()
+        if animate:
+            return dest.slide_from(orig.top_pos(), num, (orig.xstep, orig.ystep))
+
+    # execute a group of moves from the undo tree, last move first if reverse is set
+    def play_group(self, moves, reverse=False):
+        TRACE.add('play_group', len(moves), reverse)
         if reverse:
             moves.reverse()
-        self.move_cb(moves, reverse)
+        for move in moves:
+            self.do_move(move, reverse, replay=True)
+        self.analyse()
 
-    # step through moves in list
-    def move_cb(self, moves, reverse, *args):
-        if len(moves) == 0: return
-        self.do_move(moves[0], reverse, True)
-        Clock.schedule_once(partial(self.move_cb, moves[1:], reverse), self.framerate())
-
-    # execute move and update state
-    def do_move(self, move, reverse=False, replay=False):
+    # execute move and update state - the board is updated now and drawn by the animation queue
+    def do_move(self, move, reverse=False, replay=False, animate=True):
         orig, dest, score = self.game.do_move(move, reverse)
-        Logger.debug("Cards: do_move %s to %s score %d += %d" % (orig, dest, self.score, score))
+        TRACE.add('app_move', orig.type, orig.index, dest.type, dest.index, self.score, score)
+        self.anim.add(self.draw, orig, dest, animate)
         if score:
             self.score += score
             self.config.set('game', 'score', self.score)
@@ -327,36 +544,73 @@ class Solitaire(App):
         self.config.write()
         # user callback
         if not replay:
+            self.analyse()
             self.game.on_moved(move)
   
-    # save no. of moves and reset score on new game
-    def set_moves(self, val, reset=False):
-        self.moves = val
-        self.max_moves = val if reset else max(self.max_moves, val)
-        conf = self.config
-        conf.set('moves', 'count', self.moves)
-        conf.set('moves', 'max', self.max_moves)
-        if self.moves == 0 and reset:
+    # animation time for each move, zero if animation is turned off
+    def move_time(self):
+        if not self.config.getboolean('settings', 'animate'):
+            return 0
+        return self.config.getfloat('settings', 'move_time')
+
+    # update no. of moves from the undo tree - max is the end of the line redo follows -
+    # and start a new tree with the score reset on new game
+    def set_moves(self, reset=False):
+        tree, conf = self.tree, self.config
+        if reset:
+            tree.reset()
             self.score = 0
             conf.set('game', 'score', 0)
+        self.moves = tree.depth[tree.node]
+        self.max_moves = tree.depth[tree.tip(tree.node)]
         conf.write()
 
+    # search for a solution from the current position - results are cached by position
+    # so restoring a saved game or undoing back to a position already checked is free
+    def solve(self, max_nodes=50000):
+        return solver.solve(type(self.game), self.game.snapshot(), max_nodes, self.cache)
+
+    # check in the background if the current position can still be won - the search is
+    # started once no more moves have been made for settle_time, so a run of moves such as
+    # an undo group or the automatic moves after a drop is only checked at the end
+    def analyse(self):
+        self.winnable = '...'
+        self.analyser.cancel()
+        self.analyse_event.cancel()
+        self.analyse_event()
+
+    def do_analyse(self, *args):
+        self.analyser.submit(type(self.game), self.game.snapshot())
+
+    def on_analysed(self, result):
+        self.winnable = {'won': 'winnable', 'lost': 'stuck'}.get(result['verdict'], 'unknown')
+
+    def on_stop(self):
+        if self.profiler.enabled:
+            self.dump_profile()
+        self.save_play_time()
+        self.analyser.stop()
+        self.cache.close()
+        self.history.close()
+
+    def save_play_time(self):
+        self.set_play_time(self.play_time())
+        self.config.set('game', 'time', self.game_time)
+        self.config.write()
+
     # callbacks to allow android save and resume
     def on_pause(self):
+        self.save_play_time()
         return True
 
     def on_resume(self):
-        pass
-
-    def framerate(self):
-        return 1.0 / self.config.getfloat('settings','fps')
+        self.timer = time.time()
 
 # defined in kv file
 class AppPopup(Popup):
     pass
 
 if __name__ == '__main__':
-    register_games()
     Solitaire().run()
 
 
@@ -0,0 +1,125 @@
+import os
+# no display, and the command line options are ours rather than kivy's
+if __name__ == '__main__':
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+import argparse
+import gc
+import json
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import weakref
+
+from kivy.lang import Builder
+from kivy.uix.widget import Widget
+from kivy.weakproxy import WeakProxy
+
+import bench_ui
+from cards import Card
+from registry import GAME_LIST
+from tracer import TRACE
+
+PROXIES = (WeakProxy, weakref.ProxyType, weakref.CallableProxyType)
+
+
+# live widgets by class, card objects and bytes of texture memory used by the widgets
+def census():
+    gc.collect()
+    widgets, textures, cards = {}, {}, 0
+    for obj in gc.get_objects():
+        # weak proxies look like the widget they point to, or raise an error if it has gone
+        if type(obj) in PROXIES: continue
+        if isinstance(obj, Widget):
+            name = type(obj).__name__
+            widgets[name] = widgets.get(name, 0) + 1
+            texture = getattr(obj, 'texture', None)
+            if texture is not None:
+                textures[id(texture)] = texture.width*texture.height*4
+        elif isinstance(obj, Card):
+            cards += 1
+    return dict(widgets=widgets, cards=cards, texture_kb=sum(textures.values())/1024.0)
+
+
+# play the same game of name from deal seed several times, each cleared away before the
+# next - after the first few games the memory used and the objects left with an empty
+# board should stay the same. Different deals would use different amounts of memory
+def leak_check(app, name, games, moves, seed, warmup=2, limit=4096):
+    if app.game.name != name:
+        app.switch_game(name)
+    samples, per_move, board = [], [], None
+    # a small trace buffer, which fills up in the warmup games so it does not look like a leak
+    TRACE.clear(128)
+    for i in range(games):
+        bench_ui.new_deal(app, seed)
+        app.start()
+        app.anim.flush()
+        # canvas updates are run once a frame by the event loop - there is none here
+        Builder.sync()
+        if board is None:
+            board = census()
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        bench_ui.play(app, moves, seed)
+        Builder.sync()
+        if app.moves:
+            per_move.append((tracemalloc.get_traced_memory()[0] - before) / float(app.moves))
+        app.game.clear(1)
+        Builder.sync()
+        counts = census()
+        samples.append((tracemalloc.get_traced_memory()[0], counts))
+    steady = samples[warmup:]
+    growth = (steady[-1][0] - steady[0][0]) / float(max(len(steady)-1, 1))
+    leaked = dict((cls, n - steady[0][1]['widgets'].get(cls, 0)) for cls, n in steady[-1][1]['widgets'].items()
+                  if n != steady[0][1]['widgets'].get(cls, 0))
+    cards = steady[-1][1]['cards'] - steady[0][1]['cards']
+    ok = growth <= limit and not leaked and cards <= 0
+    return dict(game=name, games=games, board=board, bytes_per_game=growth, widgets_leaked=leaked,
+                cards_leaked=cards, bytes_per_move=sum(per_move)/len(per_move) if per_move else 0, ok=ok)
+
+
+# switch between all the games twice - the second time round should not leave more
+# objects behind than the first, with the same boards kept for switching back
+def switch_check(app, names):
+    rounds = []
+    for _ in range(2):
+        for name in names:
+            app.switch_game(name)
+        app.game.clear(1)
+        Builder.sync()
+        rounds.append((tracemalloc.get_traced_memory()[0], census()))
+    leaked = dict((cls, n - rounds[0][1]['widgets'].get(cls, 0)) for cls, n in rounds[1][1]['widgets'].items()
+                  if n > rounds[0][1]['widgets'].get(cls, 0))
+    return dict(game='switch', bytes=rounds[1][0] - rounds[0][0], widgets_leaked=leaked, ok=not leaked)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='report memory used by each game and check for leaks')
+    parser.add_argument('games', nargs='*', help='game names - all if not given')
+    parser.add_argument('-n', '--count', type=int, default=10, help='games to play in a row')
+    parser.add_argument('-m', '--moves', type=int, default=100, help='moves in each game')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='deal to play')
+    parser.add_argument('--limit', type=int, default=4096, help='max. growth in bytes per game')
+    args = parser.parse_args()
+    names = args.games or [name for name, _, _, _ in GAME_LIST]
+    folder = tempfile.mkdtemp(prefix='kvsol-mem-')
+    tracemalloc.start()
+    try:
+        app = bench_ui.make_app(folder)
+        # the background solver has boards of its own, which would hide a leak in the app - stop
+        # the search started when the app was built as well as any later ones
+        app.analyser.stop()
+        app.analyse = lambda: None
+        results = [leak_check(app, name, args.count, args.moves, args.seed, limit=args.limit) for name in names]
+        results.append(switch_check(app, names))
+        app.on_stop()
+    except Exception:
+        # the app's trace folder is about to be removed
+        TRACE.dump(os.getcwd())
+        raise
+    finally:
+        shutil.rmtree(folder)
+    for r in results:
+        print(json.dumps(r, sort_keys=True))
+    sys.exit(0 if all(r['ok'] for r in results) else 1)
@@ -1,5 +1,4 @@
 import ast
-from kivy.core.window import Window
 from kivy.properties import ListProperty, NumericProperty, ObjectProperty
 from kivy.uix.image import Image
 from kivy.uix.label import Label
@@ -8,6 +7,8 @@ from kivy.logger import Logger
 
 from cards import Card, Deck
 from game import BaseGame
+from tracer import TRACE
+from zobrist import card_key
 
 # mixin class for group of cards
 class CardsList(object):
@@ -44,7 +45,7 @@ class CardImage(Image, CardsList):
     def lock(self, state): pass
 
     def resize(self, xpos, ypos, size, xstep=0, ystep=0):
-        Logger.debug("Cards: image resize %s at %d,%d" % (size, xpos, ypos))
+        TRACE.add('image_resize', size, xpos, ypos)
         self.images[0].size = size
         self.pos = (xpos, ypos)
         return xpos+xstep, ypos-ystep
@@ -86,7 +87,7 @@ class CardScatter(Scatter, CardsList):
             if i > 0:
                 pos = (pos[0]+xstep, pos[1]-ystep)
         self.pos = pos
-        Logger.debug("Cards: scatter pos -> %d,%d" % pos)
+        TRACE.add('scatter_pos', *pos)
         yoff = 0
         for img in reversed(self.images):
             #Logger.debug("Cards: scatter yoffset %d -> %d" % (ystep, yoff))
@@ -108,13 +109,13 @@ class CardScatter(Scatter, CardsList):
                 child.alpha = 1
                 self.selected += 1
                 if touch.pos[1] <= self.y+child.y+child.height: break 
-            Logger.debug("Cards: selected %d out of %d cards" % (self.selected, self.cards()))
+            TRACE.add('select', self.selected, self.cards())
 
             if self.selected < self.cards():
                 self.split = self.pile.split_top_widget(self.selected)
 
             if self.selected == 1 and touch.is_double_tap:
-                Logger.debug("Cards: double tap")
+                TRACE.add('double_tap')
                 self.pile.on_release(auto=True)
                 return False
 
@@ -141,6 +142,10 @@ class CardScatter(Scatter, CardsList):
 class Pile():
     type = ''
     index = 0
+    slot = 0
+    # no. of cards drawn on piles which are not fanned out - the card under the top one
+    # is drawn too so it shows while the top card is dragged
+    stacked_depth = 2
 
     def __init__(self, game, col, row, suit='', fan='', show_count='', on_touch=None):
         self.col, self.row = col, row
@@ -148,26 +153,44 @@ class Pile():
         self.fan = fan
         self.show_count = show_count
         game.position_pile(self)
-        Logger.debug("Cards: new pile type=%s pos=%d %d fan=%s %d %d counter=%s" % 
-                    (self.type, col, row, fan, self.xstep, self.ystep, show_count))
+        game.trace('new_pile', self.type, col, row, fan, self.xstep, self.ystep, show_count)
         self.game = game
         self.layout = game.layout
+        # model: cards from the bottom up, with length of the movable run and of the 
+        # same suit run ending at each card - zero if the card is face down
+        self.stack = []
+        self.runs = []
+        self.suit_runs = []
+        # zobrist hash of the cards in the pile
+        self.hash = 0
+        # view: (card, faceup) for each card image currently drawn, from stack[first_shown] up
+        self.shown = []
+        self.first_shown = 0
         self.widgets = []
         self.counter = None
-        self.add_base(Card.base_image(suit), on_touch)
+        if self.layout:
+            self.add_base(Card.base_image(suit), on_touch)
         self.clear(1)
 
     # accessors
     def base(self): return self.widgets[0]
 
-    def size(self): return len(self.widgets)-1
+    def size(self): return len(self.stack)
 
     def top(self): return self.widgets[-1]
 
-    def bottom(self): return self.widgets[1]
-
     def next(self): return self.widgets[-2]
 
+    def top_card(self): return self.stack[-1] if self.stack else None
+
+    def bottom_card(self): return self.stack[0] if self.stack else None
+
+    # no. of cards on top which can be picked up together
+    def movable(self): return self.runs[-1] if self.stack else 0
+
+    # no. of cards on top in sequence down by rank in the same suit
+    def suit_run(self): return self.suit_runs[-1] if self.stack else 0
+
     def pid(self): return (self.type, self.index)
 
     def __str__(self): return "%s%d" % self.pid()
@@ -181,31 +204,30 @@ class Pile():
             y -= ncards*self.ystep
         return x-offset*self.xstep, y+offset*self.ystep
 
-    # build rules
-    def by_rank(self, card, base=None, order=1, suit=None, wrap=False):
-        if suit is not None and card.suit != suit:
-            return False
-        else:
-            if self.size() ==0:
-                return base is None or card.rank == base
-            else:
-                top = self.top().top_card()
-                return card.rank == top.next_rank(order,wrap)
-
-    def by_alt_color(self, card, base=None, order=1, wrap=False):
-        if self.size() == 0:
-            return base is None or card.rank == base
-        else:    
-            top = self.top().top_card()
-            return card.color() != top.color() and card.rank == top.next_rank(order,wrap)
+    # images for the top num cards, from the bottom up
+    def top_images(self, num):
+        images = []
+        for w in reversed(self.widgets[1:]):
+            if len(images) >= num: break
+            images = w.images + images
+        return images[-num:] if num > 0 else []
+
+    # list of (image, start position) to slide the top num cards in from pos, fanned by step
+    def slide_from(self, pos, num, step=(0,0)):
+        tweens = []
+        for i, img in enumerate(self.top_images(num)):
+            x, y = pos[0]+i*step[0], pos[1]-i*step[1]
+            tweens.append((img, img.parent.to_local(x, y)))
+        return tweens
 
     def counter_pos(self):
+        xsize, ysize = self.game.counter_size
         if self.show_count == 'right':
-            return self.x+self.csize[0], self.y+(self.csize[1]-Counter.ysize)/2
+            return self.x+self.csize[0], self.y+(self.csize[1]-ysize)/2
         elif self.show_count == 'left':
-            return self.x-Counter.xsize, self.y+(self.csize[1]-Counter.ysize)/2
+            return self.x-xsize, self.y+(self.csize[1]-ysize)/2
         else:
-            return self.x+(self.csize[0]-Counter.xsize)/2, self.y-Counter.ysize    
+            return self.x+(self.csize[0]-xsize)/2, self.y-ysize    
 
     # bottom of pile
     def add_base(self, image, on_touch):
@@ -217,10 +239,21 @@ class Pile():
             self.counter = Counter(pos=self.counter_pos())
             self.layout.add_widget(self.counter)
  
+    # remove the cards and take the base and counter off the screen
+    def detach(self):
+        self.clear(1)
+        self.layout.remove_widget(self.base())
+        if self.counter: self.layout.remove_widget(self.counter)
+
+    # put the base and counter back on the screen
+    def attach(self):
+        self.layout.add_widget(self.base())
+        if self.counter: self.layout.add_widget(self.counter)
+
     # redraw after screen resize
     def redraw(self):
         xpos, ypos = self.x, self.y
-        Logger.debug("Cards: redraw pile %s at %d,%d" % (self, xpos, ypos))
+        self.game.trace('redraw', self.type, self.index, xpos, ypos)
         # resize base of pile
         self.widgets[0].resize(xpos, ypos, self.csize)
         if self.counter:
@@ -235,6 +268,9 @@ class Pile():
         for w in self.widgets[base:]:
             self.layout.remove_widget(w)            
         del self.widgets[base:]
+        del self.stack[:], self.runs[:], self.suit_runs[:], self.shown[:]
+        self.first_shown = 0
+        self.hash = 0
         if self.counter: 
             if base == 0: self.layout.remove_widget(self.counter)
             self.counter.count = 0
@@ -246,15 +282,89 @@ class Pile():
             self.add_card(c)
         return len(cards)
 
-    # add card onto top 
+    # add card onto top and extend the runs
     def add_card(self, card):
-        #Logger.debug("cards: add %s to %s %d" % (card, self.type, self.index))
+        top = self.top_card()
+        if not card.faceup:
+            run = suit_run = 0
+        elif top is None or not top.faceup:
+            run = suit_run = 1
+        else:
+            run = suit_run = 1
+            if self.type != 'waste' and self.game.can_join(self, card):
+                run += self.runs[-1]
+            if card.suit == top.suit and card.rank == top.rank-1:
+                suit_run += self.suit_runs[-1]
+        self.hash ^= card_key(len(self.stack), card)
+        self.stack.append(card)
+        self.runs.append(run)
+        self.suit_runs.append(suit_run)
+
+    # pop the top num cards
+    def remove_cards(self, num=1):
+        if num <= 0: return []
+        size = len(self.stack)
+        for i in range(max(size-num, 0), size):
+            self.hash ^= card_key(i, self.stack[i])
+        cards = self.stack[-num:]
+        del self.stack[-num:], self.runs[-num:], self.suit_runs[-num:]
+        return cards
+
+    # turn over the top card - it may now join the group underneath
+    def turn_top(self, faceup):
+        if self.size() > 0:
+            self.add_cards(self.remove_cards(1), faceup)
+    
+    # pop top card(s) and optionally show card underneath
+    # flipped cards are turned over one at a time so their order is reversed
+    def take_cards(self, num, expose=False, flip=False):
+        cards = self.remove_cards(num)
+        if flip:
+            cards.reverse()
+            for c in cards: c.faceup = not(c.faceup)
+        if expose:
+            self.turn_top(True)
+        return cards
+
+    # move top num cards to another pile - returns no. of cards moved
+    def move_cards_to(self, dest, num, expose=False, cover=False, flip=False):
+        cards = self.take_cards(num, expose, flip)
+        if cover:
+            # undo expose
+            dest.turn_top(False)
+        return dest.add_cards(cards)
+
+    # update the card images to match the cards in the pile - returns no. of images added
+    # if the pile is not fanned out only the top cards are drawn, since the rest can't be seen
+    def sync(self):
+        if not self.layout: return 0
+        shown, stack, first = self.shown, self.stack, self.first_shown
+        lo = 0 if self.fan else max(len(stack)-self.stacked_depth, 0)
+        k = min(first, len(stack))
+        while k < len(stack) and k-first < len(shown) and \
+                shown[k-first][0] is stack[k] and shown[k-first][1] == stack[k].faceup:
+            k += 1
+        if lo == first:
+            self.hide_cards(len(shown)-(k-first))
+            start = k
+        else:
+            # top of the pile has moved so draw it again from the new first card shown
+            self.hide_cards(len(shown))
+            self.first_shown = start = lo
+        for i in range(start, len(stack)):
+            self.show_card(stack[i], i > self.first_shown and self.runs[i] > 1)
+        # any card we exposed should now be movable
+        if stack and stack[-1].faceup:
+            self.top().lock(False)
+        if self.counter:
+            self.counter.count = len(stack)
+        return len(stack)-max(k, lo)
+
+    # draw card on top, adding it to the group underneath if join is set
+    def show_card(self, card, join=False):
         top = self.top()
         img = CardImage(card=card, source=card.image(), size=self.csize)
-        if (card.faceup and self.type != 'waste' and
-                top.top_card() and top.top_card().faceup and 
-                self.game.can_join(self, card) ):
-            #Logger.debug("cards: add to existing scatter")
+        if join:
             top.add_image(img, step=True)
         else:
             if card.faceup:
@@ -268,45 +378,17 @@ class Pile():
             for under in self.widgets: under.lock(True)
             self.layout.add_widget(top)
             self.widgets.append(top)
-        if self.counter: self.counter.count += 1
-
-    # pop the top card(s)
-    def remove_cards(self):
-        if self.size() == 0: return []
-        w = self.widgets.pop()
-        self.layout.remove_widget(w)
-        if self.counter: self.counter.count -= w.cards()
-        return w.card_list()
-    
-    # pop top card(s) and optionally show card underneath
-    def take_cards(self, expose=False, flip=False):
-        cards = self.remove_cards()
-        if flip:
-            for c in cards: c.faceup = not(c.faceup)
-        if expose and self.size() > 0:
-            card2 = self.remove_cards()
-            self.add_cards(card2, faceup=True)
-        return cards
-
-    # move top card(s) to another pile - returns no. of cards moved
-    def move_cards_to(self, dest, expose=False, cover=False, flip=False):
-        cards = self.take_cards(expose, flip)
-        if cover and dest.size() > 0:
-            # undo expose
-            card2 = dest.remove_cards()
-            dest.add_cards(card2, faceup=False)
-        return dest.add_cards(cards)
- 
-    # move given number of cards to another pile
-    def move_num_cards_to(self, dest, total, expose=False, cover=False, flip=False):
-        moved = 0
-        while moved < total:
-            num = self.top().cards()
-            if moved + num <= total:
-                moved += self.move_cards_to(dest, expose, cover, flip)
-            else:
-                ok = self.split_top_widget(total-moved)
-                if not ok: return
+        self.shown.append((card, card.faceup))
+
+    # remove the top num card images
+    def hide_cards(self, num):
+        while num > 0:
+            if self.top().cards() > num:
+                self.split_top_widget(num)
+            w = self.widgets.pop()
+            self.layout.remove_widget(w)
+            del self.shown[-w.cards():]
+            num -= w.cards()
 
     # split the scatter on top into two as we've partally grabbed it
     # note: assumes fan='down'
@@ -330,17 +412,15 @@ class Pile():
     def move_cards_back(self):
         w = self.top()
         if w.split:
-            Logger.debug("Cards: rejoin split pile - cards=%d" % w.cards())
-            self.move_cards_to(self)
+            self.game.trace('rejoin', w.cards())
+            self.hide_cards(w.cards())
+            self.sync()
         else:
             w.pos = self.top_pos(1)
 
     # writes cards on stack to config file
     def save(self, config):
-        data = []
-        for group in self.widgets[1:]:
-            data += [card.export() for card in group.card_list()]
-        config.set('piles', str(self), data)
+        config.set('piles', str(self), [card.export() for card in self.stack])
 
     # read back the data
     def load(self, config):
@@ -350,8 +430,7 @@ class Pile():
             cards = ast.literal_eval(config.get('piles', name))
             for card in cards:
                 self.add_card(Card(*card))
-            if self.counter: 
-                self.counter.count = len(cards)
+        self.sync()
 
 
 # types of pile
@@ -368,7 +447,5 @@ class Waste(Pile):
 # label with no. of cards in pile
 class Counter(Label):
     count = NumericProperty(0)
-    xsize = Window.width*0.03
-    ysize = Window.height*0.03
 
 
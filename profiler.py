@@ -0,0 +1,164 @@
+import functools
+import importlib
+import json
+import time
+from collections import deque
+from kivy.clock import Clock
+from kivy.logger import Logger
+from kivy.uix.label import Label
+
+# methods timed when profiling is on, as module.class.method
+HOT_PATHS = [
+    'game.BaseGame.do_move',
+    'game.BaseGame.try_move',
+    'pile.Pile.add_card',
+    'pile.Pile.take_cards',
+    'pile.Pile.redraw',
+    'kivy.config.ConfigParser.write',
+]
+BUCKETS = 40
+
+
+# call count and latency histogram for one function - bucket b counts calls which
+# took less than 2**b microseconds
+class Timer(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hist = [0] * BUCKETS
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max: self.max = elapsed
+        self.hist[min(int(elapsed*1e6).bit_length(), BUCKETS-1)] += 1
+
+    # upper bound of the bucket holding the p'th percentile, in seconds
+    def percentile(self, p):
+        seen = 0
+        for b, n in enumerate(self.hist):
+            seen += n
+            if n and seen >= p*self.count:
+                return (1 << b) * 1e-6
+        return 0.0
+
+    def export(self):
+        return dict(count=self.count, total_ms=self.total*1e3, max_us=self.max*1e6,
+                    mean_us=self.total*1e6/self.count if self.count else 0,
+                    p50_us=self.percentile(0.5)*1e6, p99_us=self.percentile(0.99)*1e6,
+                    hist=self.hist)
+
+
+# times calls to methods by swapping in a wrapper while profiling is on, so there is
+# no cost at all when it is off - also records the time between frames
+class Profiler(object):
+    frames = 600
+    top = 6
+
+    def __init__(self):
+        self.enabled = False
+        self.timers = {}
+        self.patched = []
+        self.frame_times = deque(maxlen=self.frames)
+        self.last_frame = None
+        self.overlay = None
+
+    # wrap method name of owner, which may be a class or an object
+    def wrap(self, owner, name, label=None):
+        label = label or '%s.%s' % (getattr(owner, '__name__', type(owner).__name__), name)
+        own = name in vars(owner)
+        func = getattr(owner, name)
+        timer = self.timers.setdefault(label, Timer(label))
+        clock = time.perf_counter
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.add(clock() - start)
+        setattr(owner, name, timed)
+        self.patched.append((owner, name, func if own else None))
+
+    # start timing the hot paths and methods name of each (object, name) in extra
+    def enable(self, extra=()):
+        if self.enabled: return
+        Logger.info("Cards: profiling on")
+        for path in HOT_PATHS:
+            module, cls, name = path.rsplit('.', 2)
+            self.wrap(getattr(importlib.import_module(module), cls), name)
+        for owner, name in extra:
+            self.wrap(owner, name)
+        self.last_frame = None
+        Clock.schedule_interval(self.on_frame, 0)
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled: return
+        Logger.info("Cards: profiling off")
+        for owner, name, func in reversed(self.patched):
+            if func is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, func)
+        self.patched = []
+        Clock.unschedule(self.on_frame)
+        self.show_overlay(None)
+        self.enabled = False
+
+    def on_frame(self, dt):
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.frame_times.append(now - self.last_frame)
+        self.last_frame = now
+
+    def frame_percentiles(self):
+        times = sorted(self.frame_times)
+        if not times: return {}
+        return dict(('p%d_ms' % int(p*100), times[min(int(p*len(times)), len(times)-1)]*1e3)
+                    for p in (0.5, 0.95, 0.99))
+
+    # functions with the most time spent in them
+    def worst(self):
+        return sorted(self.timers.values(), key=lambda t: -t.total)[:self.top]
+
+    def report(self):
+        frames = self.frame_percentiles()
+        lines = ['frame ms  p50 %.1f  p95 %.1f  p99 %.1f' % (
+                 frames.get('p50_ms', 0), frames.get('p95_ms', 0), frames.get('p99_ms', 0))]
+        for t in self.worst():
+            if t.count:
+                lines.append('%-24s %6d  %8.1fms  p99 %dus' % (t.name, t.count, t.total*1e3,
+                                                              t.percentile(0.99)*1e6))
+        return '\n'.join(lines)
+
+    # show the report over the top of root, or hide it if root is None
+    def show_overlay(self, root):
+        if self.overlay:
+            Clock.unschedule(self.update_overlay)
+            self.overlay.parent.remove_widget(self.overlay)
+            self.overlay = None
+        if root:
+            self.overlay = Label(size_hint=(None, None), halign='left', valign='top',
+                                 font_name='RobotoMono-Regular', font_size='11sp', color=(1, 1, 0, 1))
+            root.add_widget(self.overlay)
+            self.update_overlay(0)
+            Clock.schedule_interval(self.update_overlay, 0.5)
+
+    def update_overlay(self, dt):
+        label = self.overlay
+        label.text = self.report()
+        label.texture_update()
+        label.size = label.texture_size
+        label.pos = (0, label.parent.top - label.height)
+
+    def dump(self, path):
+        data = dict(time=time.time(), frames=self.frame_percentiles(), frame_count=len(self.frame_times),
+                    timers=dict((name, t.export()) for name, t in self.timers.items()))
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        Logger.info("Cards: profile written to %s" % path)
@@ -0,0 +1,52 @@
+import importlib
+from kivy.logger import Logger
+
+# games which can be played: name, module, class and no. of decks
+# the module for a game is only imported when the game is first used
+GAME_LIST = [
+    ('Crossroads', 'games', 'Crossroads', 4),
+    ('Forty Thieves', 'games', 'Forty', 2),
+    ('Freecell', 'games', 'FreeCell', 1),
+    ("General's Patience", 'games', 'Generals', 2),
+    ('Gypsy', 'games', 'Gypsy', 2),
+    ('Hypotenuse', 'games', 'Hypotenuse', 2),
+    ('Klondike', 'games', 'Klondike', 1),
+    ('Klondike by Threes', 'games', 'Klondike3', 1),
+    ('Spider', 'games', 'Spider', 2),
+    ('Terrace', 'games', 'Terrace', 2),
+    ('Yukon', 'games', 'Yukon', 1),
+]
+
+# lookup of game class by name - acts like a dict but classes are loaded on demand
+class Registry(object):
+
+    def __init__(self, games):
+        self.games = dict((name, dict(name=name, module=module, cls=cls, decks=decks))
+                          for name, module, cls, decks in games)
+        self.classes = {}
+
+    def keys(self): return sorted(self.games.keys())
+
+    def __iter__(self): return iter(self.keys())
+
+    def __contains__(self, name): return name in self.games
+
+    def __len__(self): return len(self.games)
+
+    # details of game without loading it
+    def info(self, name): return self.games[name]
+
+    def __getitem__(self, name):
+        if name not in self.classes:
+            info = self.games[name]
+            Logger.info("Cards: load game %s" % name)
+            cls = getattr(importlib.import_module(info['module']), info['cls'])
+            if cls.name != name:
+                raise KeyError("game %s has name %s" % (info['cls'], cls.name))
+            self.classes[name] = cls
+        return self.classes[name]
+
+    def items(self): return [(name, self[name]) for name in self.keys()]
+
+
+GAMES = Registry(GAME_LIST)
@@ -0,0 +1,237 @@
+import os
+# only when run as a script - the app imports this module and keeps its kivy options
+if __name__ == '__main__':
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+import argparse
+import functools
+import json
+import multiprocessing
+import time
+from kivy.logger import Logger
+
+from cards import Card, Deck
+from registry import GAMES
+
+# a replay is a json object with the game, the deal and the moves played:
+#   {"game": name, "deal": seed or null, "deck": cards if there is no seed,
+#    "moves": [move, ...], "score": score, "final": [pile, ...], "options": {name: value}}
+# each move is a string src-dst-num with flags, e.g. t3-f0-1s, where piles are the first
+# letter of the pile type and the index, and the flags are f=flip, a=append, s=split.
+# final is the cards in each pile at the end, face up cards have an upper case suit, and
+# options are the game's settings - any not given are the game's defaults
+VERSION = 1
+TYPES = {'t': 'tableau', 'f': 'foundation', 'w': 'waste'}
+FLAGS = [('f', 'flip'), ('a', 'append'), ('s', 'split')]
+
+
+def encode_move(move):
+    src, dst = move['src'], move['dst']
+    flags = ''.join(c for c, key in FLAGS if move.get(key))
+    return '%s%d-%s%d-%d%s' % (src[0][0], src[1], dst[0][0], dst[1], move['n'], flags)
+
+
+def decode_move(text):
+    src, dst, num = text.split('-')
+    move = dict(src=(TYPES[src[0]], int(src[1:])), dst=(TYPES[dst[0]], int(dst[1:])),
+                n=int(num.rstrip('fas')))
+    for c, key in FLAGS:
+        if c in num: move[key] = True
+    return move
+
+
+def encode_piles(snapshot):
+    return [' '.join('%d%s' % (c[0], c[1].upper() if len(c) > 2 else c[1]) for c in cards)
+            for cards in snapshot]
+
+
+# replay for a game of cls dealt from deck with seed deal, moves are dicts as logged by on_move
+def export(cls, deal, deck, moves, score, snapshot, options=None):
+    replay = dict(version=VERSION, game=cls.name, deal=deal, moves=[encode_move(m) for m in moves],
+                  score=score, final=encode_piles(snapshot))
+    if options:
+        replay['options'] = options
+    if deal is None:
+        replay['deck'] = [[card.rank, card.suit] for card in deck.d]
+    return replay
+
+
+def save(path, replay):
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'w') as f:
+        json.dump(replay, f, separators=(',', ':'))
+
+
+def load(path):
+    with open(path) as f:
+        replay = json.load(f)
+    if replay.get('version') != VERSION:
+        raise ValueError('%s: unsupported replay version %r' % (path, replay.get('version')))
+    return replay
+
+
+# deck for the replay, in the order it was dealt
+def deck_for(replay):
+    cls = GAMES[replay['game']]
+    deck = Deck(cls.decks)
+    if replay['deal'] is None:
+        deck.d = [Card(rank, suit) for rank, suit in replay['deck']]
+        deck.rewind()
+    else:
+        deck.rewind(shuffle=True, seed=replay['deal'])
+    return deck
+
+
+# plays back replays on a game with no display - each move is made through the game
+# rules, and the moves the game makes in response must match the ones recorded
+class Replayer(object):
+
+    def __init__(self, cls):
+        self.game = cls(on_move=self.record)
+        self.game.build()
+        self.moves = []
+
+    def record(self, orig, dest, num, callback=False, **args):
+        args.update(src=orig.pid(), dst=dest.pid(), n=num)
+        self.moves.append(encode_move(args))
+        self.game.do_move(args)
+        self.game.on_moved(args)
+
+    def deal(self, deck):
+        self.game.clear(1)
+        self.game.deal(deck)
+
+    # set the game options the replay was played with
+    def set_options(self, options):
+        game = self.game
+        for key in game.options:
+            setattr(game, key, bool(options.get(key, getattr(type(game), key))))
+
+    # make the first of the recorded moves, returns the moves made by the game - none if
+    # the cards moved are not a face up group which can be picked up, or the rules reject it
+    def step(self, text):
+        game = self.game
+        self.moves = []
+        move = decode_move(text)
+        if move.get('flip') and hasattr(game, 'deal_next'):
+            game.deal_next()
+        else:
+            orig = game.piles[move['src'][0]][move['src'][1]]
+            dest = game.piles[move['dst'][0]][move['dst'][1]]
+            if 0 < move['n'] <= (1 if orig.type == 'foundation' else orig.movable()):
+                game.try_move(orig, dest, move['n'])
+        return self.moves
+
+    # list of errors found playing back the replay - empty if it is ok. If undo is set the
+    # moves are then undone one step at a time, which must give back each earlier position
+    def verify(self, replay, undo=False):
+        try:
+            self.set_options(replay.get('options') or {})
+            self.deal(deck_for(replay))
+        except (KeyError, ValueError, IndexError, AttributeError) as e:
+            return ['bad deal: %s: %s' % (type(e).__name__, e)]
+        moves, i = replay['moves'], 0
+        steps = []
+        while i < len(moves):
+            if undo:
+                steps.append((i, self.game.snapshot()))
+            try:
+                made = self.step(moves[i])
+            except (KeyError, ValueError, IndexError) as e:
+                return ['move %d %s: bad move: %s' % (i, moves[i], e)]
+            if not made:
+                return ['move %d %s: illegal' % (i, moves[i])]
+            for j, move in enumerate(made):
+                if i+j >= len(moves) or moves[i+j] != move:
+                    return ['move %d %s: game made %s, replay has %s' %
+                            (i+j, moves[i], move, moves[i+j] if i+j < len(moves) else 'no move')]
+            i += len(made)
+        errors = []
+        game = self.game
+        if replay.get('score') is not None and replay['score'] != game.foundation_cards:
+            errors.append('score is %d, replay has %d' % (game.foundation_cards, replay['score']))
+        if replay.get('final') is not None and replay['final'] != encode_piles(game.snapshot()):
+            errors.append('final position does not match')
+        if undo and not errors:
+            errors += self.check_undo(moves, steps)
+        return errors
+
+    # undo moves back to the start of each step in turn, checking the position each time
+    def check_undo(self, moves, steps):
+        game, end = self.game, len(moves)
+        for i, snapshot in reversed(steps):
+            for text in reversed(moves[i:end]):
+                game.do_move(decode_move(text), reverse=True)
+            if game.snapshot() != snapshot:
+                return ['move %d %s: undo does not give back the position before it' % (i, moves[i])]
+            end = i
+        return []
+
+
+_replayers = {}
+
+# check a list of replay files - runs in the worker processes, with one game of each type
+def verify_files(paths, undo=False):
+    results = []
+    for path in paths:
+        try:
+            replay = load(path)
+            cls = GAMES[replay['game']]
+        except (IOError, ValueError, KeyError) as e:
+            results.append((path, ['cannot load: %s' % e]))
+            continue
+        if cls.name not in _replayers:
+            _replayers[cls.name] = Replayer(cls)
+        results.append((path, _replayers[cls.name].verify(replay, undo)))
+    return results
+
+
+# verify all replays in paths on a pool of jobs processes, returns dict of errors by path
+def verify_all(paths, jobs=None, chunk=200, undo=False):
+    chunks = [paths[i:i+chunk] for i in range(0, len(paths), chunk)]
+    pool = multiprocessing.Pool(jobs)
+    failed = {}
+    try:
+        for results in pool.imap_unordered(functools.partial(verify_files, undo=undo), chunks):
+            for path, errors in results:
+                if errors: failed[path] = errors
+    finally:
+        pool.close()
+        pool.join()
+    return failed
+
+
+# delete all but the newest keep replays in folder
+def prune(folder, keep):
+    paths = find([folder]) if os.path.isdir(folder) else []
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:max(len(paths)-keep, 0)]:
+        os.remove(path)
+
+
+def find(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, files in os.walk(path):
+                found += [os.path.join(folder, f) for f in sorted(files) if f.endswith('.replay')]
+        else:
+            found.append(path)
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='check replays are legal and end in the recorded position')
+    parser.add_argument('paths', nargs='+', help='replay files or folders of .replay files')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-u', '--undo', action='store_true', help='also check undoing each move')
+    args = parser.parse_args()
+    paths = find(args.paths)
+    start = time.time()
+    failed = verify_all(paths, args.jobs, undo=args.undo)
+    elapsed = time.time() - start
+    for path in sorted(failed):
+        print('%s: %s' % (path, '; '.join(failed[path])))
+    Logger.info("Cards: verified %d replays in %.2fs" % (len(paths), elapsed))
+    print('%d replays, %d failed, %.0f per second' % (len(paths), len(failed), len(paths)/max(elapsed, 1e-6)))
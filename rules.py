@@ -0,0 +1,54 @@
+from cards import Card, Deck
+
+# bit mask for each type of pile, used to check where cards can be moved from
+TYPES = {'tableau': 1, 'foundation': 2, 'waste': 4}
+ALL_TYPES = 7
+
+# one of each card, in order of Card.id
+CARDS = [Card(r, s) for s in Deck.suits for r in range(1, 14)]
+
+# compiled tables shared between rules
+_tables = {}
+
+# can card be placed on top of below?
+def builds_on(build, card, below, order, wrap):
+    if build == 'any':
+        return True
+    elif build == 'none':
+        return False
+    if card.rank != below.next_rank(order, wrap):
+        return False
+    if build == 'suit':
+        return card.suit == below.suit
+    elif build == 'alt_color':
+        return card.color() != below.color()
+    return True
+
+# table indexed by [below.id][card.id] which is True if card can go on below
+def compile_table(build, order=1, wrap=False):
+    key = (build, order, wrap)
+    if key not in _tables:
+        _tables[key] = [[builds_on(build, card, below, order, wrap) for card in CARDS] for below in CARDS]
+    return _tables[key]
+
+
+# how cards build on one type of pile
+#   build: 'rank', 'suit' or 'alt_color' to build by rank in given order, 'any' or 'none'
+#   base: rank of card which can be put on an empty pile, None for any card
+#   sources: types of pile cards can be moved from, default is any
+#   max_cards: max. no. of cards which can be moved at once
+class Rule(object):
+
+    def __init__(self, build='any', order=1, wrap=False, base=None, sources=None, max_cards=None):
+        self.build = build
+        self.base = base
+        self.max_cards = max_cards
+        self.sources = ALL_TYPES
+        if sources is not None:
+            self.sources = sum([TYPES[t] for t in sources])
+        self.table = compile_table(build, order, wrap)
+
+    # can we move num cards from pile src?
+    def allows(self, src, num):
+        return (self.sources & TYPES[src.type] != 0 and 
+                (self.max_cards is None or num <= self.max_cards))
@@ -0,0 +1,184 @@
+import os
+# command line options are for the server, not for kivy
+if __name__ == '__main__':
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+import argparse
+import asyncio
+import itertools
+import json
+import resource
+import time
+import tracemalloc
+from collections import deque
+from kivy.logger import Logger
+
+from cards import Deck
+from registry import GAMES
+
+# game played by a client - a game with no display, moves are applied straight away
+class Session(object):
+
+    def __init__(self, sid, cls, deal=None):
+        self.id = sid
+        self.deal = deal
+        traced = tracemalloc.is_tracing()
+        if traced: before = tracemalloc.get_traced_memory()[0]
+        self.game = cls()
+        self.game.build()
+        deck = Deck(cls.decks)
+        deck.rewind(shuffle=True, seed=deal)
+        self.game.deal(deck)
+        self.memory = tracemalloc.get_traced_memory()[0] - before if traced else None
+        self.moves = 0
+        self.time = 0.0
+
+    def pile(self, pid):
+        type, index = pid
+        piles = self.game.piles[type]
+        if not 0 <= index < len(piles):
+            raise IndexError('no %s pile %r' % (type, index))
+        return piles[index]
+
+    def board(self):
+        game = self.game
+        piles = [dict(pile=pile.pid(), cards=[card.export() for card in pile.stack])
+                 for pile in game.all_piles()]
+        return dict(session=self.id, game=game.name, deal=self.deal, piles=piles,
+                    score=game.foundation_cards, won=game.is_won(), moves=self.moves)
+
+    def legal(self):
+        moves = [[orig.pid(), dest.pid(), num] for orig, dest, num in self.game.legal_moves()]
+        return dict(session=self.id, moves=moves, deal=hasattr(self.game, 'deal_next'))
+
+    def move(self, src, dst, n):
+        return self.game.try_move(self.pile(src), self.pile(dst), n)
+
+    def deal_next(self):
+        if not hasattr(self.game, 'deal_next'): return False
+        key = self.game.hash
+        self.game.deal_next()
+        return self.game.hash != key
+
+
+# serves games to clients as json, one request and one reply per line:
+#   {"op": "new", "game": name, "deal": seed} - new session, deal is optional
+#   {"op": "board"|"legal"|"close", "session": id}
+#   {"op": "move", "session": id, "src": [type, index], "dst": [type, index], "n": num}
+#   {"op": "deal", "session": id} - deal from the pack
+#   {"op": "stats"} - server statistics
+# replies have "ok": true with the result, or "ok": false and an "error"
+class Server(object):
+    history = 10000
+
+    def __init__(self):
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        self.latency = deque(maxlen=self.history)
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                writer.write(json.dumps(self.request(line)).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            # client went away, or sent a line longer than the stream limit
+            Logger.info("Cards: client connection %s: %s" % (type(e).__name__, e))
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def request(self, line):
+        start = time.perf_counter()
+        req, op = {}, None
+        try:
+            req = json.loads(line)
+            op = req.get('op')
+            if op not in ('new', 'board', 'legal', 'move', 'deal', 'close', 'stats'):
+                raise ValueError('unknown op %r' % op)
+            reply = getattr(self, 'do_' + op)(req)
+            reply['ok'] = True
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            reply = dict(ok=False, error='%s: %s' % (type(e).__name__, e))
+        except Exception as e:
+            # a bug in the rules should not take down the connection
+            Logger.exception("Cards: request %r failed" % line)
+            reply = dict(ok=False, error='internal error: %s: %s' % (type(e).__name__, e))
+        elapsed = time.perf_counter() - start
+        self.requests += 1
+        self.latency.append(elapsed)
+        # only moves the game made count towards the time per move
+        session = self.sessions.get(req.get('session')) if reply.get('moved') else None
+        if session and op in ('move', 'deal'):
+            session.moves += 1
+            session.time += elapsed
+        return reply
+
+    def session(self, req):
+        return self.sessions[req['session']]
+
+    def do_new(self, req):
+        cls = GAMES[req['game']]
+        deal = req.get('deal')
+        if deal is not None and (not isinstance(deal, int) or isinstance(deal, bool)):
+            raise TypeError('deal should be an int, not %r' % deal)
+        session = Session(next(self.ids), cls, deal)
+        self.sessions[session.id] = session
+        return session.board()
+
+    def do_board(self, req):
+        return self.session(req).board()
+
+    def do_legal(self, req):
+        return self.session(req).legal()
+
+    def do_move(self, req):
+        session = self.session(req)
+        moved = session.move(req['src'], req['dst'], int(req['n']))
+        return dict(session.board(), moved=moved)
+
+    def do_deal(self, req):
+        session = self.session(req)
+        moved = session.deal_next()
+        return dict(session.board(), moved=moved)
+
+    def do_close(self, req):
+        del self.sessions[req['session']]
+        return dict(session=req['session'])
+
+    # memory per session, and latency of requests over the last history requests
+    def do_stats(self, req):
+        count = len(self.sessions)
+        traced = [s.memory for s in self.sessions.values() if s.memory is not None]
+        latency = sorted(self.latency)
+        percentile = lambda p: latency[min(int(p*len(latency)), len(latency)-1)]*1e3 if latency else 0
+        moves = sum(s.moves for s in self.sessions.values())
+        return dict(sessions=count, requests=self.requests,
+                    rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                    session_kb=sum(traced)/len(traced)/1024 if traced else None,
+                    latency_ms=dict(p50=percentile(0.5), p99=percentile(0.99), max=percentile(1)),
+                    move_ms=sum(s.time for s in self.sessions.values())*1e3/moves if moves else None)
+
+
+async def serve(host, port):
+    server = Server()
+    listener = await asyncio.start_server(server.handle, host, port)
+    Logger.info("Cards: serving games on %s:%d" % (host, port))
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='serve games as json over a socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--trace-memory', action='store_true', help='measure memory used by each session')
+    args = parser.parse_args()
+    if args.trace_memory:
+        tracemalloc.start()
+    asyncio.run(serve(args.host, args.port))
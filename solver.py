@@ -0,0 +1,197 @@
+import threading
+import time
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+# search for a solution from a position - runs on a copy of the game with no display
+# results are a dict with:
+#   verdict: 'won' if solved, 'lost' if there is no solution, 'unknown' if we gave up
+#   moves: list of moves to win, in the same form as Solitaire.on_move logs them
+#   nodes: no. of positions searched
+# if max_time is set the search also gives up after that many seconds
+class Solver(object):
+    deal = 'deal'
+
+    def __init__(self, cls, snapshot, max_nodes=50000, max_time=None):
+        self.game = cls(on_move=self.record)
+        self.game.build()
+        self.game.restore(snapshot)
+        self.max_nodes = max_nodes
+        self.deadline = time.time() + max_time if max_time else None
+        self.nodes = 0
+        self.moves = []
+        self.cancelled = False
+        self.timed_out = False
+
+    # move handler for the game - apply the move now and keep a copy so we can undo it
+    def record(self, orig, dest, num, callback=False, **args):
+        args.update(src=orig.pid(), dst=dest.pid(), n=num)
+        self.moves.append(dict(args))
+        self.game.do_move(args)
+        self.game.on_moved(args)
+        if callback: callback()
+
+    # possible moves from this position, best last
+    def candidates(self):
+        game = self.game
+        found = [(self.score(orig, dest, num), orig, dest, num) for orig, dest, num in game.legal_moves()]
+        if hasattr(game, 'deal_next'):
+            found.append((0, self.deal, None, 0))
+        found.sort(key=lambda c: c[0])
+        return found
+
+    # rank moves - to foundation, then ones which uncover a card, from foundation last
+    def score(self, orig, dest, num):
+        if dest.type == 'foundation':
+            return 4
+        if orig.type == 'foundation':
+            return -1
+        if orig.size() > num and not orig.stack[-num-1].faceup:
+            return 3
+        if orig.size() == num and dest.size() > 0:
+            return 2
+        return 1 if dest.size() > 0 else 0
+
+    # make a move, returns list of moves applied including any automatic ones
+    def apply(self, cand):
+        self.moves = []
+        _, orig, dest, num = cand
+        if orig == self.deal:
+            self.game.deal_next()
+        else:
+            self.game.try_move(orig, dest, num)
+        return self.moves
+
+    def undo(self, moves):
+        for move in reversed(moves):
+            self.game.do_move(dict(move), reverse=True)
+
+    # depth first search, skipping positions we have already seen
+    def solve(self):
+        game = self.game
+        seen = set([game.state_key()])
+        stack = [self.candidates()]
+        path = []
+        while stack:
+            if game.is_won():
+                return self.result('won', [m for moves in path for m in moves])
+            if self.deadline and time.time() > self.deadline:
+                self.timed_out = True
+            if self.nodes >= self.max_nodes or self.cancelled or self.timed_out:
+                return self.result('unknown')
+            cands = stack[-1]
+            if not cands:
+                stack.pop()
+                if path: self.undo(path.pop())
+                continue
+            moves = self.apply(cands.pop())
+            if not moves: continue
+            key = game.state_key()
+            if key in seen:
+                self.undo(moves)
+                continue
+            seen.add(key)
+            self.nodes += 1
+            path.append(moves)
+            stack.append(self.candidates())
+        return self.result('lost')
+
+    def result(self, verdict, moves=None):
+        Logger.debug("Cards: solver %s %s after %d nodes" % (self.game.name, verdict, self.nodes))
+        return dict(verdict=verdict, moves=moves or [], nodes=self.nodes, budget=self.max_nodes)
+
+    # solve, checking the cache first if given - the moves are only right for this exact
+    # board, but the verdict also holds with the tableau piles swapped round, so it is kept
+    # under the canonical key as well, without the moves
+    def search(self, cache=None):
+        if cache is None:
+            return self.solve()
+        game = self.game
+        exact = cache.key(game.name, game.hash)
+        canonical = cache.key(game.name, game.state_key())
+        result = cache.get(exact)
+        if self.usable(result):
+            return result
+        result = cache.get(canonical)
+        if self.usable(result) and result['verdict'] != 'won':
+            return result
+        result = self.solve()
+        # a search cut short did not use its whole budget, so is not kept
+        if not self.cancelled and not self.timed_out:
+            cache.put(exact, result)
+            if canonical != exact:
+                cache.put(canonical, dict(result, moves=[]))
+        return result
+
+    # cached result is final, or gave up after searching at least as far as we would
+    def usable(self, result):
+        return result is not None and (result['verdict'] != 'unknown' or result['budget'] >= self.max_nodes)
+
+
+# solve position given by snapshot of game cls
+def solve(cls, snapshot, max_nodes=50000, cache=None):
+    return Solver(cls, snapshot, max_nodes).search(cache)
+
+
+# checks positions in a worker thread - submitting a new position cancels the search
+# in progress, and callback(result) is called from the kivy main loop when one finishes.
+# Each search is limited to max_time seconds, so it does not hold up the display for long
+class Analyser(object):
+
+    def __init__(self, callback, max_nodes=50000, cache=None, max_time=2.0):
+        self.callback = callback
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.cache = cache
+        self.lock = threading.Condition()
+        self.pending = None
+        self.solver = None
+        self.stopped = False
+        # count of positions submitted or cancelled - a result is only passed on if no
+        # other position has been asked for since its search was started
+        self.serial = 0
+        self.thread = threading.Thread(target=self.run, name='analyser')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, cls, snapshot):
+        with self.lock:
+            self.serial += 1
+            self.pending = cls, snapshot
+            if self.solver: self.solver.cancelled = True
+            self.lock.notify()
+
+    # drop the search in progress and any waiting to start, as the position has changed
+    def cancel(self):
+        with self.lock:
+            self.serial += 1
+            self.pending = None
+            if self.solver: self.solver.cancelled = True
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.solver: self.solver.cancelled = True
+            self.lock.notify()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while self.pending is None and not self.stopped:
+                    self.lock.wait()
+                if self.stopped: return
+                cls, snapshot = self.pending
+                self.pending = None
+                serial = self.serial
+                self.solver = solver = Solver(cls, snapshot, self.max_nodes, self.max_time)
+            result = solver.search(self.cache)
+            with self.lock:
+                self.solver = None
+                if solver.cancelled or self.pending: continue
+            Clock.schedule_once(lambda dt, result=result, serial=serial: self.done(result, serial))
+
+    # called in the main loop - skip the result if the board has changed since
+    def done(self, result, serial):
+        if serial == self.serial:
+            self.callback(result)
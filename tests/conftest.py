@@ -0,0 +1,7 @@
+import os
+import sys
+
+# kivy reads the command line and settings from the environment when it is imported
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,41 @@
+from registry import GAMES
+import replay
+
+
+# spider board with the king to two of spades built on tableau 0 over a face down card,
+# and the ace on tableau 1
+def spider_board():
+    player = replay.Replayer(GAMES['Spider'])
+    game = player.game
+    snapshot = [[] for _ in game.all_piles()]
+    snapshot[0] = [(5, 'h')] + [(rank, 's', True) for rank in range(13, 1, -1)]
+    snapshot[1] = [(9, 'd', True), (1, 's', True)]
+    game.restore(snapshot)
+    return player
+
+
+def test_spider_completed_suit_moved_to_foundation():
+    player = spider_board()
+    assert player.step('t1-t0-1') == ['t1-t0-1s', 't0-f0-13a']
+    assert player.game.foundation()[0].size() == 13
+
+
+def test_spider_completed_suit_left_for_auto_drop():
+    player = spider_board()
+    player.set_options(dict(auto_complete=False))
+    assert player.step('t1-t0-1') == ['t1-t0-1s']
+    assert player.game.foundation()[0].size() == 0
+    assert player.game.auto_drop()
+    assert player.game.foundation()[0].size() == 13
+
+
+def test_replay_keeps_options():
+    cls = GAMES['Spider']
+    deck = replay.deck_for(dict(game=cls.name, deal=5))
+    player = replay.Replayer(cls)
+    player.deal(deck)
+    data = replay.export(cls, 5, deck, [], 0, player.game.snapshot(), dict(auto_complete=False))
+    assert player.verify(data) == []
+    assert player.game.auto_complete is False
+    assert player.verify(dict(data, options=None)) == []
+    assert player.game.auto_complete is True
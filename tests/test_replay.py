@@ -0,0 +1,63 @@
+import os
+import random
+
+import pytest
+
+from cards import Deck
+from registry import GAMES
+import replay
+
+
+# play num random legal moves from deal seed, returns the replay of the game
+def record(cls, seed, num):
+    player = replay.Replayer(cls)
+    deck = Deck(cls.decks)
+    deck.rewind(shuffle=True, seed=seed)
+    player.deal(deck)
+    game, rng, moves = player.game, random.Random(seed), []
+    for _ in range(num):
+        player.moves = []
+        legal = game.legal_moves()
+        if legal:
+            game.try_move(*rng.choice(legal))
+        elif hasattr(game, 'deal_next'):
+            game.deal_next()
+        moves += player.moves
+    return replay.export(cls, seed, deck, [replay.decode_move(m) for m in moves],
+                         game.foundation_cards, game.snapshot())
+
+
+@pytest.mark.parametrize('name', GAMES.keys())
+def test_round_trip(name, tmpdir):
+    cls = GAMES[name]
+    data = record(cls, 7, 80)
+    path = os.path.join(str(tmpdir), 'game.replay')
+    replay.save(path, data)
+    loaded = replay.load(path)
+    assert loaded == data
+    assert replay.Replayer(cls).verify(loaded, undo=True) == []
+
+
+def test_encode_move():
+    move = dict(src=('tableau', 3), dst=('foundation', 0), n=1, split=True)
+    assert replay.encode_move(move) == 't3-f0-1s'
+    assert replay.decode_move('t3-f0-1s') == move
+    assert replay.decode_move('w0-w1-3fa') == dict(src=('waste', 0), dst=('waste', 1), n=3,
+                                                    flip=True, append=True)
+
+
+def test_changed_replay_fails():
+    cls = GAMES['Klondike']
+    data = record(cls, 7, 80)
+    player = replay.Replayer(cls)
+    assert player.verify(dict(data, score=data['score']+1)) == \
+        ['score is %d, replay has %d' % (data['score'], data['score']+1)]
+    assert player.verify(dict(data, moves=['t0-t0-1'] + data['moves']))[0].startswith('move 0 t0-t0-1: illegal')
+    assert player.verify(dict(data, moves=data['moves'][1:]))
+
+
+def test_unknown_version(tmpdir):
+    path = os.path.join(str(tmpdir), 'game.replay')
+    replay.save(path, dict(record(GAMES['Klondike'], 1, 5), version=replay.VERSION+1))
+    with pytest.raises(ValueError):
+        replay.load(path)
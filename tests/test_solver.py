@@ -0,0 +1,60 @@
+import os
+from cards import Deck
+from cache import ResultCache
+from registry import GAMES
+import replay
+import solver
+
+
+def deal(name, seed):
+    cls = GAMES[name]
+    game = cls()
+    game.build()
+    deck = Deck(cls.decks)
+    deck.rewind(shuffle=True, seed=seed)
+    game.deal(deck)
+    return cls, game.snapshot()
+
+
+# play the solver's moves through the game rules from snapshot, returns True if they win
+def plays_out(cls, snapshot, moves):
+    player = replay.Replayer(cls)
+    player.game.restore(snapshot)
+    texts = [replay.encode_move(move) for move in moves]
+    i = 0
+    while i < len(texts):
+        made = player.step(texts[i])
+        if not made or made != texts[i:i+len(made)]:
+            return False
+        i += len(made)
+    return player.game.is_won()
+
+
+def test_swapped_piles_get_their_own_moves(tmpdir):
+    cache = ResultCache(os.path.join(str(tmpdir), 'solver'), 100)
+    cls, snapshot = deal('Klondike', 1)
+    result = solver.solve(cls, snapshot, 50000, cache)
+    assert result['verdict'] == 'won'
+    assert plays_out(cls, snapshot, result['moves'])
+    # the same board with two tableau piles swapped round has the same canonical key
+    swapped = list(snapshot)
+    swapped[0], swapped[1] = swapped[1], swapped[0]
+    again = solver.solve(cls, swapped, 50000, cache)
+    assert again['verdict'] == 'won'
+    assert plays_out(cls, swapped, again['moves'])
+    # and a second lookup of each board comes from the cache with the right moves
+    assert solver.solve(cls, swapped, 1, cache)['moves'] == again['moves']
+    assert solver.solve(cls, snapshot, 1, cache)['moves'] == result['moves']
+    cache.close()
+
+
+def test_canonical_verdict_is_shared(tmpdir):
+    cache = ResultCache(os.path.join(str(tmpdir), 'solver'), 100)
+    cls, snapshot = deal('Klondike', 1)
+    lost = dict(verdict='lost', moves=[], nodes=10, budget=10)
+    probe = solver.Solver(cls, snapshot)
+    cache.put(cache.key(probe.game.name, probe.game.state_key()), lost)
+    swapped = list(snapshot)
+    swapped[2], swapped[5] = swapped[5], swapped[2]
+    assert solver.solve(cls, swapped, 50000, cache) == lost
+    cache.close()
@@ -0,0 +1,81 @@
+from kivy.config import ConfigParser
+
+import replay
+from undotree import UndoTree
+
+
+def tree():
+    tree = UndoTree(ConfigParser())
+    tree.reset()
+    return tree
+
+
+def add(tree, *texts):
+    for text in texts:
+        tree.add(replay.decode_move(text))
+
+
+def played(tree):
+    return [replay.encode_move(move) for move in tree.played()]
+
+
+def test_undo_and_redo_follow_the_line():
+    t = tree()
+    add(t, 't0-t1-1', 't2-f0-1', 't1-f0-1a')
+    assert played(t) == ['t0-t1-1', 't2-f0-1', 't1-f0-1a']
+    node = t.undo()
+    assert [replay.encode_move(m) for m in t.group(node)] == ['t2-f0-1', 't1-f0-1a']
+    assert played(t) == ['t0-t1-1']
+    assert t.redo() == node
+    assert t.redo() is None
+    assert t.depth[t.node] == 2
+
+
+def test_goto_and_branch():
+    t = tree()
+    add(t, 't0-t1-1', 't2-t3-1')
+    first = t.node
+    t.undo()
+    add(t, 't4-t5-1')
+    second = t.node
+    assert t.parent[first] == t.parent[second]
+    # back to the first line - one node reversed and one played from where they split
+    up, down = t.goto(first)
+    assert (up, down) == ([second], [first])
+    assert played(t) == ['t0-t1-1', 't2-t3-1']
+    assert t.tip(0) == first
+    assert t.next_line() == second
+    t.goto(t.next_line())
+    assert played(t) == ['t0-t1-1', 't4-t5-1']
+
+
+def test_same_move_follows_existing_line():
+    t = tree()
+    add(t, 't0-t1-1', 't2-t3-1')
+    count = len(t.parent)
+    t.undo()
+    add(t, 't2-t3-1')
+    assert len(t.parent) == count
+
+
+def test_part_of_group_made():
+    t = tree()
+    add(t, 't0-t1-1', 't2-f0-1', 't3-f0-1a')
+    t.undo()
+    # the same move again, but without the automatic move after it this time
+    add(t, 't2-f0-1')
+    assert played(t) == ['t0-t1-1', 't2-f0-1']
+    node = t.undo()
+    assert [replay.encode_move(m) for m in t.group(node)] == ['t2-f0-1']
+    assert played(t) == ['t0-t1-1']
+
+
+def test_save_and_load():
+    t = tree()
+    add(t, 't0-t1-1', 't2-f0-1', 't3-f0-1a')
+    t.undo()
+    add(t, 't4-t5-1s')
+    loaded = UndoTree(t.config)
+    loaded.load()
+    assert loaded.parent == t.parent and loaded.moves == t.moves and loaded.node == t.node
+    assert played(loaded) == played(t)
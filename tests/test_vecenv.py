@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from registry import GAMES
+import vecenv
+
+
+# game cls set up at board k of env
+def board(env, k):
+    game = env.cls()
+    game.build()
+    game.restore(env.snapshot(k))
+    return game
+
+
+def legal_actions(env, game):
+    P = env.num_piles
+    index = dict((id(pile), p) for p, pile in enumerate(game.all_piles()))
+    return sorted((index[id(orig)]*P + index[id(dest)])*vecenv.MAX_MOVE + num-1
+                  for orig, dest, num in game.legal_moves())
+
+
+# play random legal moves on a few boards, checking the mask against BaseGame.legal_moves
+# and each move against the same move made by the game
+@pytest.mark.parametrize('name', ['Klondike', 'Klondike by Threes', 'Freecell', 'Spider'])
+def test_legal_mask_matches_game(name):
+    cls = GAMES[name]
+    env = vecenv.make(cls, 4)
+    env.reset(seeds=[1, 2, 3, 4])
+    rng = np.random.RandomState(0)
+    for _ in range(60):
+        mask = env.legal_moves()
+        actions = []
+        for k in range(env.num_boards):
+            game = board(env, k)
+            assert list(np.nonzero(mask[k, :env.deal_action])[0]) == legal_actions(env, game)
+            legal = np.nonzero(mask[k])[0]
+            actions.append(rng.choice(legal) if len(legal) else 0)
+        expected = []
+        for k, action in enumerate(actions):
+            # an illegal action, when there are no legal ones, leaves the board as it is
+            game = board(env, k)
+            if mask[k, action] and action == env.deal_action:
+                game.deal_next()
+            elif mask[k, action]:
+                P = env.num_piles
+                src, dst = action // (vecenv.MAX_MOVE*P), (action // vecenv.MAX_MOVE) % P
+                piles = game.all_piles()
+                assert game.try_move(piles[src], piles[dst], action % vecenv.MAX_MOVE + 1)
+            expected.append(game.snapshot())
+        env.step(actions)
+        for k in range(env.num_boards):
+            assert env.snapshot(k) == expected[k]
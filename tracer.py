@@ -0,0 +1,107 @@
+import logging
+import os
+import sys
+import time
+from kivy.logger import Logger
+
+# text for each event, filled in from the event args when the trace is printed
+FORMATS = {
+    'position_pile': 'position pile %s%d @ %dx%d',
+    'new_pile': 'new pile type=%s pos=%d %d fan=%s %d %d counter=%s',
+    'try_move': 'try_move %d from %r to %r',
+    'do_move': 'do_move %r',
+    'on_release': 'on_release %s %d auto=%s',
+    'move_back': 'move back',
+    'deal': 'deal from %s',
+    'start_pile': 'start pile %s%d',
+    'refill': 'deal to empty tableau pile %d',
+    'image_resize': 'image resize %s at %d,%d',
+    'scatter_pos': 'scatter pos -> %d,%d',
+    'select': 'selected %d out of %d cards',
+    'double_tap': 'double tap',
+    'redraw': 'redraw pile %s%d at %d,%d',
+    'rejoin': 'rejoin split pile - cards=%d',
+    'on_move': 'on_move %d',
+    'play_group': 'play %d moves reverse=%s',
+    'goto': 'goto node %d - %d back %d forward',
+    'app_move': 'do_move %s%d to %s%d score %d += %d',
+    'undo': 'undo %d',
+    'redo': 'redo %d of %d',
+    'flush': 'flush %d animation steps',
+}
+
+
+# ring buffer of the last size events - each is stored as (time, name, args) and only
+# turned into text when dumped, so tracing costs little more than a tuple per event
+class Tracer(object):
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.events = [None] * size
+        self.count = 0
+        self.dumped = 0
+        self.folder = None
+        self.echo = False
+
+    def add(self, name, *args):
+        self.events[self.count % self.size] = (time.time(), name, args)
+        self.count += 1
+        if self.echo:
+            Logger.debug("Cards: " + FORMATS[name] % args)
+
+    # drop all the events, and change the no. kept if size is given
+    def clear(self, size=None):
+        self.size = size or self.size
+        self.events = [None] * self.size
+        self.count = self.dumped = 0
+
+    # events oldest first
+    def recent(self):
+        if self.count <= self.size:
+            return self.events[:self.count]
+        i = self.count % self.size
+        return self.events[i:] + self.events[:i]
+
+    def lines(self):
+        return ['%s.%03d %s' % (time.strftime('%H:%M:%S', time.localtime(t)), int(t*1000) % 1000,
+                                FORMATS[name] % args) for t, name, args in self.recent()]
+
+    # write the events to a file in folder, returns the file name or None if nothing new
+    def dump(self, folder=None):
+        folder = folder or self.folder
+        if folder is None or self.count == self.dumped: return None
+        self.dumped = self.count
+        path = os.path.join(folder, 'trace-%s.txt' % time.strftime('%Y%m%d-%H%M%S'))
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.lines()) + '\n')
+        Logger.info("Cards: trace of %d events written to %s" % (min(self.count, self.size), path))
+        return path
+
+    # dump to folder if there is an uncaught exception, either in the kivy event loop or
+    # anywhere else - events are also logged as they happen if the log level is debug
+    def install(self, folder):
+        from kivy.base import ExceptionHandler, ExceptionManager
+        self.folder = folder
+        self.echo = Logger.isEnabledFor(logging.DEBUG)
+        tracer = self
+
+        class DumpTrace(ExceptionHandler):
+            def handle_exception(self, inst):
+                tracer.dump()
+                return ExceptionManager.RAISE
+        ExceptionManager.add_handler(DumpTrace())
+        hook = sys.excepthook
+
+        def excepthook(*args):
+            self.dump()
+            hook(*args)
+        sys.excepthook = excepthook
+
+
+TRACE = Tracer()
+
+
+# used instead of TRACE.add by games with no display, so a solver search does not push the
+# events from the app out of the buffer
+def ignore(name, *args):
+    pass
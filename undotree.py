@@ -0,0 +1,185 @@
+import ast
+
+import replay
+
+# tree of the moves made in a game, so lines which were undone are kept - each node has
+# the group of moves which led to it from its parent, so lines with the same start share
+# the nodes for it, and node 0 is the position after the deal.
+# saved in the undo section of the config with an entry for each node: parent child moves,
+# where child is where redo goes from the node and the moves are in the replay format
+class UndoTree(object):
+    section = 'undo'
+
+    def __init__(self, config):
+        self.config = config
+        self.parent, self.child, self.children, self.depth, self.moves = [], [], [], [], []
+        self.node = 0
+        # no. of moves in the group of the current node which have been made
+        self.made = 0
+
+    # start a new game
+    def reset(self):
+        self.parent, self.child, self.children, self.depth, self.moves = [-1], [-1], [[]], [0], [[]]
+        conf = self.config
+        if conf.has_section(self.section):
+            conf.remove_section(self.section)
+        conf.add_section(self.section)
+        self.save(0)
+        self.set_node(0)
+
+    def save(self, node):
+        self.config.set(self.section, str(node), '%d %d %s' % (self.parent[node], self.child[node],
+                                                               ' '.join(self.moves[node])))
+
+    def set_node(self, node):
+        self.node = node
+        self.made = len(self.moves[node])
+        self.config.set(self.section, 'node', node)
+
+    def load(self):
+        conf = self.config
+        if not conf.has_section(self.section):
+            return self.load_list()
+        self.parent, self.child, self.children, self.depth, self.moves = [], [], [], [], []
+        while conf.has_option(self.section, str(len(self.parent))):
+            fields = conf.get(self.section, str(len(self.parent))).split()
+            parent = int(fields[0])
+            if parent >= 0:
+                self.children[parent].append(len(self.parent))
+            self.parent.append(parent)
+            self.child.append(int(fields[1]))
+            self.children.append([])
+            self.depth.append(self.depth[parent]+1 if parent >= 0 else 0)
+            self.moves.append(fields[2:])
+        self.node = conf.getint(self.section, 'node')
+        self.made = len(self.moves[self.node])
+
+    # read moves saved as a list with an entry for each group of moves, as they were
+    # before the tree was added - the list is removed once it is in the tree
+    def load_list(self):
+        conf = self.config
+        self.reset()
+        if not conf.has_section('moves'): return
+        count, top = conf.getint('moves', 'count'), conf.getint('moves', 'max')
+        for i in range(top):
+            for move in ast.literal_eval(conf.get('moves', str(i))):
+                self.add(move)
+        self.set_node(count)
+        conf.remove_section('moves')
+
+    # add move to the current line - appended to the last node if it goes with the move
+    # before, else a new node. If the same move was made from here before, the line it
+    # started is followed instead, so it is not stored twice
+    def add(self, move):
+        node, text = self.node, replay.encode_move(move)
+        if move.get('append') and node > 0:
+            group = self.moves[node]
+            if self.made == len(group):
+                group.append(text)
+                self.save(node)
+            elif group[self.made] != text:
+                # not as it went last time - keep the moves so far in a line of its own
+                self.new_node(self.parent[node], group[:self.made] + [text])
+                return
+            self.made += 1
+            return
+        self.split()
+        node = self.node
+        for child in self.children[node]:
+            if self.moves[child][0] == text:
+                self.child[node] = child
+                self.save(node)
+                self.set_node(child)
+                self.made = 1
+                return
+        self.new_node(node, [text])
+
+    def new_node(self, parent, moves):
+        node = len(self.parent)
+        self.parent.append(parent)
+        self.child.append(-1)
+        self.children.append([])
+        self.children[parent].append(node)
+        self.depth.append(self.depth[parent]+1)
+        self.moves.append(moves)
+        self.child[parent] = node
+        self.save(parent)
+        self.save(node)
+        self.set_node(node)
+
+    # if only some of the moves in the current node were made this time round, keep them
+    # in a node of their own, so the ones not made are not undone
+    def split(self):
+        node = self.node
+        if self.made < len(self.moves[node]):
+            self.new_node(self.parent[node], self.moves[node][:self.made])
+
+    # moves which led to node
+    def group(self, node):
+        return [replay.decode_move(text) for text in self.moves[node]]
+
+    # moves from the start to the current position
+    def played(self):
+        moves = [text for node in self.line() for text in self.moves[node]]
+        moves = moves[:len(moves) - len(self.moves[self.node]) + self.made]
+        return [replay.decode_move(text) for text in moves]
+
+    # step back to the parent, returns the node to reverse or None at the start
+    def undo(self):
+        self.split()
+        node = self.node
+        if node == 0: return None
+        self.set_node(self.parent[node])
+        return node
+
+    # step forward along the last line visited, returns the node to play or None at the end
+    def redo(self):
+        node = self.child[self.node]
+        if node < 0: return None
+        self.set_node(node)
+        return node
+
+    # end of the line redo would follow from node
+    def tip(self, node):
+        while self.child[node] >= 0:
+            node = self.child[node]
+        return node
+
+    # nodes from the start to the current node
+    def line(self):
+        nodes, node = [], self.node
+        while node > 0:
+            nodes.append(node)
+            node = self.parent[node]
+        return nodes[::-1]
+
+    # go to target by the shortest path - returns the nodes to reverse, from the current
+    # one back to the common ancestor, and the nodes to play from there down to target
+    def goto(self, target):
+        self.split()
+        a, b = self.node, target
+        up, down = [], []
+        while self.depth[a] > self.depth[b]:
+            up.append(a)
+            a = self.parent[a]
+        while self.depth[b] > self.depth[a]:
+            down.append(b)
+            b = self.parent[b]
+        while a != b:
+            up.append(a)
+            down.append(b)
+            a, b = self.parent[a], self.parent[b]
+        down.reverse()
+        # redo now follows the line to target
+        for node in down:
+            self.child[self.parent[node]] = node
+            self.save(self.parent[node])
+        self.set_node(target)
+        return up, down
+
+    # end of the line after the current one, in the order they were started
+    def next_line(self):
+        tips = [node for node in range(len(self.parent)) if not self.children[node]]
+        tip = self.tip(self.node)
+        later = [node for node in tips if node > tip]
+        return later[0] if later else tips[0]
@@ -0,0 +1,271 @@
+# batch of boards for one game held as numpy arrays, for training and testing automated players
+# numpy is only needed here - the app itself does not use it
+import numpy as np
+
+from cards import Card, Deck
+import games
+import rules
+
+# max. no. of cards moved at once
+MAX_MOVE = 13
+EMPTY = 52
+
+
+# K boards of game cls - pile p is game.all_piles()[p], with arrays:
+#   cards: K x P x C card ids (-1 if no card), up: face up flags, size: no. of cards in each pile
+# actions are numbered (src*P + dst)*MAX_MOVE + num-1, with deal_action to deal from the pack
+class VecEnv(object):
+
+    def __init__(self, cls, boards):
+        self.cls = cls
+        self.game = cls()
+        self.game.build()
+        piles = self.game.all_piles()
+        self.piles = piles
+        self.num_boards = K = boards
+        self.num_piles = P = len(piles)
+        self.num_cards = C = 52*cls.decks
+        self.max_score = self.game.max_score
+        self.deal_action = P*P*MAX_MOVE
+        self.num_actions = self.deal_action + 1
+        self.cards = np.full((K, P, C), -1, np.int8)
+        self.up = np.zeros((K, P, C), bool)
+        self.size = np.zeros((K, P), np.int16)
+        self.boards = np.arange(K)
+        self.types = np.array([rules.TYPES[p.type] for p in piles])
+        self.tableau = self.types == rules.TYPES['tableau']
+        self.foundation = self.types == rules.TYPES['foundation']
+        self.waste = self.types == rules.TYPES['waste']
+        # build[d, top, card] is True if card can go on top card of pile d, with top=EMPTY if empty
+        self.build = np.zeros((P, 53, 52), bool)
+        # join[p, below, card] is True if card can be picked up together with the card below
+        self.join = np.ones((P, 52, 52), bool)
+        # allows[s*MAX_MOVE + num-1, d] if the rule for d lets us move num cards from s
+        self.allows = np.zeros((P*MAX_MOVE, P), bool)
+        for d, pile in enumerate(piles):
+            rule = cls.rules.get(pile.type)
+            if pile.type in cls.joins:
+                self.join[d] = cls.joins[pile.type].table
+            if rule is None: continue
+            self.build[d, :52] = rule.table
+            self.build[d, EMPTY] = [self.game.can_start(pile, rule, card) for card in rules.CARDS]
+            for s, src in enumerate(piles):
+                if s != d:
+                    self.allows[s*MAX_MOVE:(s+1)*MAX_MOVE, d] = [rule.allows(src, n+1)
+                                                                 for n in range(MAX_MOVE)]
+        # offsets of each pile in the flattened arrays
+        self.start = (self.boards[:, None]*P + np.arange(P))*C
+        self.build_start = np.arange(P)*53*52
+        self.mask = None
+
+    # deal a new game on each board, from the seed for that board or a random shuffle
+    def reset(self, seeds=None):
+        for k in range(self.num_boards):
+            self.game.clear(1)
+            deck = Deck(self.cls.decks)
+            deck.rewind(shuffle=True, seed=None if seeds is None else seeds[k])
+            self.game.deal(deck)
+            self.load(k, self.game.snapshot())
+        self.mask = None
+
+    # set board k from a BaseGame.snapshot
+    def load(self, k, snapshot):
+        self.cards[k] = -1
+        self.up[k] = False
+        for p, cards in enumerate(snapshot):
+            cards = [Card(*c) for c in cards]
+            self.cards[k, p, :len(cards)] = [card.id for card in cards]
+            self.up[k, p, :len(cards)] = [card.faceup for card in cards]
+            self.size[k, p] = len(cards)
+        self.mask = None
+
+    # board k in the same form as BaseGame.snapshot
+    def snapshot(self, k):
+        return [[Card(c % 13 + 1, Deck.suits[c // 13], up).export()
+                 for c, up in zip(self.cards[k, p, :n], self.up[k, p, :n])]
+                for p, n in enumerate(self.size[k])]
+
+    def foundation_cards(self):
+        return self.size[:, self.foundation].sum(axis=1)
+
+    # top card of each pile or EMPTY
+    def top_cards(self):
+        top = self.cards.ravel().take(self.start + self.size-1).astype(np.intp)
+        return np.where(self.size > 0, top, EMPTY)
+
+    # length of the run of face up cards which can be picked up from the top of pile ps
+    # on boards ks
+    def runs(self, ks, ps):
+        cards, up, join = self.cards.ravel(), self.up.ravel(), self.join.ravel()
+        start = self.start[ks, ps]
+        join_start = ps*52*52
+        i = self.size[ks, ps].astype(np.intp)-1
+        pos = start + np.maximum(i, 0)
+        card = cards.take(pos).astype(np.intp)
+        alive = (i >= 0) & up.take(pos)
+        run = alive.astype(np.intp)
+        for _ in range(MAX_MOVE-1):
+            i -= 1
+            pos = start + np.maximum(i, 0)
+            below = cards.take(pos).astype(np.intp)
+            alive &= (i >= 0) & up.take(pos) & join.take(join_start + below*52 + card, mode='clip')
+            if not alive.any(): break
+            run += alive
+            card = below
+        return run
+
+    # no. of cards which can be moved from each pile - only the top card from foundations and waste
+    def movable(self):
+        run = self.runs(self.boards[:, None], np.arange(self.num_piles))
+        return np.where(self.tableau, run, np.minimum(run, 1))
+
+    # K x num_actions mask of legal moves
+    def legal_moves(self):
+        if self.mask is not None:
+            return self.mask
+        P = self.num_piles
+        # each group of num cards which can be picked up from board ks, pile src
+        ks, src, num = np.nonzero(np.arange(1, MAX_MOVE+1) <= self.movable()[:, :, None])
+        num += 1
+        group = self.cards.ravel().take(self.start[ks, src] + self.size[ks, src] - num)
+        # and the piles it can go on
+        top = self.top_cards()[ks]
+        ok = self.build.ravel().take(self.build_start + top*52 + group[:, None])
+        ok &= self.allows.take(src*MAX_MOVE + num-1, axis=0)
+        ok &= self.can_add(ks, num)
+        i, dst = np.nonzero(ok)
+        self.mask = np.zeros((self.num_boards, self.num_actions), bool)
+        self.mask[ks[i], (src[i]*P + dst)*MAX_MOVE + num[i]-1] = True
+        self.mask[:, self.deal_action] = self.can_deal()
+        return self.mask
+
+    # extra conditions for the game, returns flags for moving num cards from boards ks to each pile
+    def can_add(self, ks, num):
+        return True
+
+    def can_deal(self):
+        return False
+
+    # apply one action on each board - illegal actions are ignored
+    # returns change in no. of foundation cards, and flag set if the game is won
+    def step(self, actions):
+        actions = np.asarray(actions)
+        legal = self.legal_moves()[self.boards, actions]
+        before = self.foundation_cards()
+        deal = legal & (actions == self.deal_action)
+        ks = np.nonzero(legal & ~deal)[0]
+        a = actions[ks]
+        src, dst, num = a // (MAX_MOVE*self.num_piles), (a // MAX_MOVE) % self.num_piles, a % MAX_MOVE + 1
+        self.move(ks, src, dst, num)
+        self.on_moved(ks, dst)
+        self.deal_next(np.nonzero(deal)[0])
+        self.mask = None
+        after = self.foundation_cards()
+        return after-before, after == self.max_score
+
+    # move num cards from src to dst on boards ks - as per Pile.move_cards_to with expose
+    # set for moves from the tableau, if flip is set cards are turned over and reversed
+    def move(self, ks, src, dst, num, flip=False):
+        if len(ks) == 0: return
+        src_size, dst_size = self.size[ks, src].astype(int), self.size[ks, dst].astype(int)
+        for j in range(num.max()):
+            m = j < num
+            k, s, d = ks[m], src[m], dst[m]
+            i = src_size[m]-1-j if flip else src_size[m]-num[m]+j
+            self.cards[k, d, dst_size[m]+j] = self.cards[k, s, i]
+            self.up[k, d, dst_size[m]+j] = self.up[k, s, i] ^ flip
+        for j in range(num.max()):
+            m = j < num
+            i = src_size[m]-1-j
+            self.cards[ks[m], src[m], i] = -1
+            self.up[ks[m], src[m], i] = False
+        self.size[ks, src] -= num
+        self.size[ks, dst] += num
+        expose = self.tableau[src] & (self.size[ks, src] > 0)
+        self.up[ks[expose], src[expose], self.size[ks, src][expose]-1] = True
+
+    def on_moved(self, ks, dst):
+        pass
+
+    def deal_next(self, ks):
+        pass
+
+
+class VecKlondike(VecEnv):
+
+    def __init__(self, cls, boards):
+        super(VecKlondike, self).__init__(cls, boards)
+        self.pack, self.pile = [self.piles.index(p) for p in self.game.waste()]
+
+    def can_deal(self):
+        return self.size[:, self.pack] + self.size[:, self.pile] > 0
+
+    # deal from the pack, or turn the waste pile over if the pack is empty
+    def deal_next(self, ks):
+        deal = self.size[ks, self.pack] > 0
+        kd, kr = ks[deal], ks[~deal]
+        self.move(kd, np.full_like(kd, self.pack), np.full_like(kd, self.pile),
+                  np.minimum(self.size[kd, self.pack], self.cls.deal_by), flip=True)
+        self.move(kr, np.full_like(kr, self.pile), np.full_like(kr, self.pack),
+                  self.size[kr, self.pile], flip=True)
+        self.on_moved(ks, None)
+
+    # auto-deal onto empty waste pile
+    def on_moved(self, ks, dst):
+        ks = ks[(self.size[ks, self.pile] == 0) & (self.size[ks, self.pack] > 0)]
+        self.move(ks, np.full_like(ks, self.pack), np.full_like(ks, self.pile),
+                  np.minimum(self.size[ks, self.pack], self.cls.deal_by), flip=True)
+
+
+class VecFreeCell(VecEnv):
+
+    # limit number of cards moved to tableau by number of free cells and empty tableau piles
+    def can_add(self, ks, num):
+        empty = self.size[ks] == 0
+        free = empty[:, self.waste].sum(axis=1)
+        spaces = empty[:, self.tableau].sum(axis=1)[:, None] - (empty & self.tableau)
+        max_move = (free[:, None]+1) << spaces
+        return ~self.tableau | (num[:, None] <= max_move)
+
+
+class VecSpider(VecEnv):
+
+    def __init__(self, cls, boards):
+        super(VecSpider, self).__init__(cls, boards)
+        self.pack = self.piles.index(self.game.waste()[0])
+        self.first_foundation = np.nonzero(self.foundation)[0][0]
+
+    # only a whole suit can be moved to the foundations
+    def can_add(self, ks, num):
+        return ~self.foundation | (num[:, None] == MAX_MOVE)
+
+    # can't deal onto empty piles
+    def can_deal(self):
+        return (self.size[:, self.pack] > 0) & ~(self.size[:, self.tableau] == 0).any(axis=1)
+
+    # deal a card onto each tableau pile in turn
+    def deal_next(self, ks):
+        for p in np.nonzero(self.tableau)[0]:
+            ks = ks[self.size[ks, self.pack] > 0]
+            dst = np.full_like(ks, p)
+            self.move(ks, np.full_like(ks, self.pack), dst, np.full_like(ks, 1), flip=True)
+            self.on_moved(ks, dst)
+
+    # move a completed suit straight to the first empty foundation
+    def on_moved(self, ks, dst):
+        done = self.tableau[dst] & (self.runs(ks, dst) >= MAX_MOVE)
+        ks, dst = ks[done], dst[done]
+        empty = self.size[ks][:, self.foundation] == 0
+        found = self.first_foundation + np.argmax(empty, axis=1)
+        self.move(ks, dst, found, np.full_like(ks, MAX_MOVE))
+
+
+ENVS = {games.Klondike: VecKlondike, games.FreeCell: VecFreeCell, games.Spider: VecSpider}
+
+
+# environment for K boards of game cls - one of Klondike, FreeCell or Spider or a subclass
+def make(cls, boards):
+    for base in cls.__mro__:
+        if base in ENVS:
+            return ENVS[base](cls, boards)
+    raise ValueError("no batch environment for %s" % cls.name)
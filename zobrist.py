@@ -0,0 +1,21 @@
+import random
+
+# zobrist keys for hashing board positions - the tables are filled in a fixed order when
+# the module is loaded, so a position has the same key in every process and session
+MASK = (1 << 64) - 1
+# most cards in one pile, with four decks, and most piles in a game
+MAX_DEPTH = 4*52
+MAX_SLOTS = 64
+_random = random.Random(0x5eed)
+
+# random key for each card and face up state at each depth in a pile
+_cards = [[_random.getrandbits(64) for _ in range(104)] for _ in range(MAX_DEPTH)]
+
+# odd multiplier for each pile slot, to mix pile hashes into the board hash
+_slots = [_random.getrandbits(64) | 1 for _ in range(MAX_SLOTS)]
+
+def card_key(depth, card):
+    return _cards[depth][2*card.id + card.faceup]
+
+def mix(value, slot):
+    return (value * _slots[slot]) & MASK